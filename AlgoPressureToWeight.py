@@ -1,31 +1,25 @@
-import struct
-import json
 import numpy as np
-import statistics
-from collections import deque
-from datetime import datetime
-#from sklearn.linear_model import LinearRegression
-from scipy.stats import linregress
-
+from CalibrationModel import CalibrationModel
+from SampleRingBuffer import SampleRingBuffer
+from OnlineStats import SlidingWindowVariance, SampleRateEstimator
+from TemperatureCompensation import TemperatureCompensation
+from SampleFilter import SampleFilter
 
 
 class AlgoPressureToWeight:
-    def __init__(self, sampleRate = 10, printData:bool = False, dbg:bool = True):
+    # sample counts in cfg (settle_hold_dur, feather_*) and maxDatasetLen are
+    # given for REF_RATE and rescaled to the actual sample rate
+    REF_RATE = 10
+    RATE_SCALED_CFG = ("settle_hold_dur", "feather_p", "feather_n")
+
+    def __init__(self, sampleRate = 10, printData:bool = False, dbg:bool = True,
+                 cfg:dict = None, maxDatasetLen:int = 200):
         self.dbg = dbg
         self.printData = printData
         self.inCalibration = False
         self.calib_target = 0
         self.weight_baseline = 0
         self.std_dev = 1.34
-        self.window_len = int(3 * sampleRate)
-        if self.window_len < 30:
-            self.window_len = 30
-
-        self.stddev_sample_sz = int (30 * sampleRate)
-        if self.stddev_sample_sz < 30:
-            self.stddev_sample_sz = 30
-
-        self.MAX_DATASET_LEN = 200
 
         self.cfg = {
                 "thres_n": 3,
@@ -34,27 +28,59 @@ class AlgoPressureToWeight:
                 "feather_n": (6, 3),
                 "error_tor":0.10,   #10%
                 "auto_tare": True,
+                "track_noise": False,           #keep adapting std_dev outside calibration
+                "noise_track_alpha": 0.02,
+                "temp_comp": False,             #subtract the fitted thermal drift from 'p' samples
+                "temp_comp_window": 3000,
+                "temp_comp_min_spread": 0.2,    #degC a quiet segment must span to be used for the fit
+                "temp_comp_refit": 100,
+                "auto_rate": False,             #estimate the sample rate and rescale the windows to it
+                "rate_tolerance": 0.2,          #relative rate change that triggers a rescale
+                "decimate_to": 0,               #Hz, average down faster input (needs auto_rate), 0: off
+                "prefilter_median": 0,          #running median length ahead of detection, 0: off
+                "prefilter_iir": 0.0,           #first-order IIR coefficient after the median, 0: off
+                "warm_check_len": 50,           #quiet samples to verify the noise level of a warm start
+                "warm_noise_ratio": 2.0,        #live/stored noise beyond this (either way) makes it stale
         }
-        self.dataset_fit = []
-        self.dataset_p = []
-        self.meta_info_p = []
-        self.dataset_t = []
-        self.meta_info_t = []
+        if cfg is not None:
+            self.cfg.update(cfg)
+        self.base_cfg = {k: self.cfg[k] for k in self.RATE_SCALED_CFG}
+        self.base_dataset_len = maxDatasetLen
+        self.__scaleWindows(sampleRate)
+
+        self.rate_est = SampleRateEstimator()
+        self.decim_n = 1
+        self.decim_sum = 0.0
+        self.decim_cnt = 0
+        self.dataset_p = SampleRingBuffer(self.buf_capacity)
+        self.dataset_t = SampleRingBuffer(self.MAX_DATASET_LEN)
+        self.noise = SlidingWindowVariance(self.stddev_sample_sz)
+        self.tcomp = TemperatureCompensation(self.cfg["temp_comp_window"],
+                                             self.cfg["temp_comp_min_spread"],
+                                             self.cfg["temp_comp_refit"])
+        self.prefilter = SampleFilter(self.cfg["prefilter_median"], self.cfg["prefilter_iir"])
         self.idx_start = -1
         self.idx_stop = -1
         self.sum_diff = 0
+        self.n_windows = 0
 
-        self.model = None
+        self.model = CalibrationModel()
+        self.warm_check = None
+        self.warm_state = None
 
         self.subscribers = []
         self.last_weight = (0, 0)
 
     def updateCalibStatus(self, inCalibration:bool = False, calib_target:float = 0.0):
         if (not self.inCalibration) and inCalibration:
-            self.dataset_p = []
-            self.meta_info_p = []
-            self.dataset_t = []
-            self.meta_info_t = []
+            if len(self.dataset_t) > 0:
+                # compensated values refer to the temperature calibration starts at
+                self.tcomp.setReference(self.dataset_t.value(self.dataset_t.last))
+            self.dataset_p.clear()
+            self.dataset_t.clear()
+            self.noise.reset()
+            self.tcomp.breakSegment()
+            self.warm_check = None  #recalibrating, no need to verify the warm start
             self.idx_start = -1
             self.idx_stop = -1
             self.sum_diff = 0
@@ -67,8 +93,97 @@ class AlgoPressureToWeight:
     def subscribe(self, cb):
         self.subscribers.append(cb)
 
+    def getCalibState(self) -> dict:
+        """Everything calibration produced, for warmStart() after a restart."""
+        return {
+            "model": self.model.toDict(),
+            "std_dev": self.std_dev,
+            "weight_baseline": float(self.weight_baseline),
+            "last_weight": [float(self.last_weight[0]), None if self.last_weight[1] is None else float(self.last_weight[1])],
+            "sample_rate": self.sampleRate,
+            "temp_coef": self.tcomp.coef,
+        }
+
+    def warmStart(self, state:dict):
+        """Resume from a saved getCalibState().
+
+        The stored noise level is checked against the noise of the first
+        warm_check_len samples, estimated from the median sample-to-sample
+        difference so a weight put on meanwhile does not count. If they differ
+        by more than warm_noise_ratio the state is considered stale and dropped
+        (warm_state "stale"), otherwise it is kept ("verified"). Until then
+        warm_state is "pending".
+        """
+        self.model = CalibrationModel.fromDict(state["model"])
+        self.std_dev = state["std_dev"]
+        self.weight_baseline = state.get("weight_baseline", 0)
+        self.last_weight = tuple(state.get("last_weight", (0, 0)))
+        self.tcomp.coef = state.get("temp_coef", 0.0)
+        self.warm_check = []
+        self.warm_state = "pending"
+        if self.dbg:
+            print(f"warm start: {len(self.model)} calibration points, stdev {self.std_dev}, baseline {self.weight_baseline}")
+
+    def __checkWarmStart(self, val:float):
+        self.warm_check.append(val)
+        if len(self.warm_check) <= self.cfg["warm_check_len"]:
+            return
+        # median |diff| of white noise is 0.6745 * sqrt(2) * sigma
+        live = float(np.median(np.abs(np.diff(self.warm_check)))) / 0.9539
+        ratio = self.cfg["warm_noise_ratio"]
+        self.warm_check = None
+        if self.std_dev / ratio <= live <= self.std_dev * ratio:
+            self.warm_state = "verified"
+            return
+
+        print(f"calibration state is stale: noise {live:.3f} now, {self.std_dev:.3f} when saved; recalibrate")
+        self.warm_state = "stale"
+        self.model = CalibrationModel()
+        self.std_dev = live
+        self.weight_baseline = 0
+        self.last_weight = (0, 0)
+
+    def __scaleWindows(self, sampleRate:float):
+        self.sampleRate = sampleRate
+        scale = sampleRate / self.REF_RATE
+        self.window_len = max(30, int(3 * sampleRate))
+        self.stddev_sample_sz = max(30, int(30 * sampleRate))
+        self.MAX_DATASET_LEN = max(1, round(self.base_dataset_len * scale))
+        # taring needs the last stddev_sample_sz samples, events need headroom
+        self.buf_capacity = 2 * max(self.MAX_DATASET_LEN, self.stddev_sample_sz)
+
+        self.cfg["settle_hold_dur"] = max(1, round(self.base_cfg["settle_hold_dur"] * scale))
+        for key in ("feather_p", "feather_n"):
+            self.cfg[key] = tuple(max(1, round(n * scale)) for n in self.base_cfg[key])
+
+    def __checkRate(self, t_ns:int):
+        """Rescale windows (and the decimation) once the measured rate moved away from sampleRate."""
+        self.rate_est.update(t_ns)
+        # only between events, and every full window of new timestamps
+        if -1 != self.idx_start or self.rate_est.n_updates % self.rate_est.window:
+            return
+        rate = self.rate_est.rate()
+        if rate is None:
+            return
+        decimate_to = self.cfg["decimate_to"]
+        decim_n = int(rate // decimate_to) if decimate_to and rate > decimate_to else 1
+        rate_eff = rate / decim_n
+        if decim_n == self.decim_n and abs(rate_eff - self.sampleRate) <= self.cfg["rate_tolerance"] * self.sampleRate:
+            return
+
+        if self.dbg:
+            print(f"sample rate {rate:.1f} Hz, decimation {decim_n}, windows rescaled from {self.sampleRate:.1f} to {rate_eff:.1f} Hz")
+        self.decim_n = decim_n
+        self.decim_sum = 0.0
+        self.decim_cnt = 0
+        self.__scaleWindows(rate_eff)
+        self.dataset_p.resize(self.buf_capacity)
+        self.dataset_t.resize(self.MAX_DATASET_LEN)
+        self.noise = SlidingWindowVariance(self.stddev_sample_sz)
+
     def __onWindowedEventStart(self):
-        seq_start = self.meta_info_p[self.idx_start][1]
+        self.n_windows += 1
+        seq_start = self.dataset_p.seq(self.idx_start)
         seq_stop = seq_start
         if self.dbg:
             print(f"window event - start, {seq_start}, {seq_stop}, {self.sum_diff}, {self.inCalibration}, {self.calib_target}")
@@ -76,12 +191,15 @@ class AlgoPressureToWeight:
 
     def __onWindowedEventStop(self):
         if self.dbg:
-            seq_start = self.meta_info_p[self.idx_start][1]
-            seq_stop = self.meta_info_p[self.idx_stop][1]
+            seq_start = self.dataset_p.seq(self.idx_start)
+            seq_stop = self.dataset_p.seq(self.idx_stop)
             print(f"window event - stop, {seq_start}, {seq_stop}, {self.sum_diff}, {self.inCalibration}, {self.calib_target}")
 
         self.__adj_sel_window()
+        self.__evalWindowedEvent(self.dataset_p.timestamp(self.idx_stop))
+        self.idx_start = -1
 
+    def __evalWindowedEvent(self, t_ns):
         weight = None
         if self.inCalibration:
             if self.sum_diff > 0:
@@ -90,7 +208,7 @@ class AlgoPressureToWeight:
                 weight = 0  #force to be zero
             self.__updateDSFit()
         else:
-            if self.model is not None:
+            if self.model.fitted:
                 data_in = [self.sum_diff]
                 if self.sum_diff > 0:
                     weight = self.__predict(data_in)[0] + self.weight_baseline
@@ -101,7 +219,7 @@ class AlgoPressureToWeight:
                     if weight is None:
                         weight = self.__predict(data_in)[0] + self.weight_baseline
                 if self.dbg:
-                    print(f"window event - stop (predict), {seq_start}, {seq_stop}, {self.sum_diff}, {self.inCalibration}, {self.weight_baseline}, {weight}")
+                    print(f"window event - stop (predict), {self.sum_diff}, {self.inCalibration}, {self.weight_baseline}, {weight}")
             elif self.sum_diff < 0:
                 if self.__isLastWeightRemoved():
                     weight = 0
@@ -109,11 +227,70 @@ class AlgoPressureToWeight:
         self.last_weight = (self.sum_diff, weight)
 
         if weight is not None:
-            for cb in self.subscribers:
-                cb(weight, self.meta_info_p[self.idx_stop][0])
+            # before the subscribers run, they may save getCalibState()
             self.weight_baseline = weight
-
-        self.idx_start = -1
+            for cb in self.subscribers:
+                cb(weight, t_ns)
+
+    def isEventOpen(self):
+        return -1 != self.idx_start
+
+    def detectEventsBatch(self, values, start:int = 0):
+        """Vectorized equivalent of the diff/threshold/settle detection in updateData.
+
+        Runs over a whole array of pressure samples with the current std_dev and
+        cfg, and returns (idx_start, idx_stop, sum_diff) arrays of the settled
+        events after the feather adjustment of __adj_sel_window. Only events
+        triggered at or after index `start` are reported; earlier samples serve as
+        look-back for the feathered windows. Events still open at the end of the
+        array are not reported.
+        """
+        p = np.asarray(values, dtype=np.float64)
+        n = len(p)
+        no_events = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))
+        if n < 2:
+            return no_events
+
+        diff = np.diff(p)
+        idx_trig = np.flatnonzero(np.abs(diff) > self.cfg["thres_n"] * self.std_dev) + 1
+        idx_trig = idx_trig[idx_trig >= max(start, 1)]
+        if len(idx_trig) == 0:
+            return no_events
+
+        # an open event settles once settle_hold_dur quiet samples follow a trigger
+        hold = self.cfg["settle_hold_dur"]
+        grp_break = np.flatnonzero(np.diff(idx_trig) > hold) + 1
+        grp_first = np.concatenate(([0], grp_break))
+        grp_last = np.concatenate((grp_break - 1, [len(idx_trig) - 1]))
+
+        idx_event = idx_trig[grp_first]
+        idx_settled = idx_trig[grp_last] + hold
+        sum_trig = np.add.reduceat(diff[idx_trig - 1], grp_first)
+
+        closed = idx_settled < n
+        idx_event = idx_event[closed]
+        idx_settled = idx_settled[closed]
+        rising = sum_trig[closed] > 0
+
+        fp = self.cfg["feather_p"]
+        fn = self.cfg["feather_n"]
+        idx_start = np.where(rising, idx_event - fp[0], idx_event - fn[0])
+        idx_stop = np.where(rising, idx_event + fp[1], idx_event + fn[1])
+        idx_start = np.maximum(idx_start, 0)
+        idx_stop = np.minimum(idx_stop, idx_settled)
+
+        return idx_start, idx_stop, p[idx_stop] - p[idx_start]
+
+    def prefilterBatch(self, values):
+        """Run `values` through the pre-filter like updateData would, for detectEventsBatch."""
+        if not self.prefilter.enabled:
+            return np.asarray(values, dtype=np.float64)
+        return self.prefilter.filterBatch(values)
+
+    def onBatchEvent(self, sum_diff:float, t_ns:int):
+        """Evaluate an event found by detectEventsBatch() as if it had just settled."""
+        self.sum_diff = sum_diff
+        self.__evalWindowedEvent(t_ns)
 
     def __adj_sel_window(self):
         if self.sum_diff > 0:
@@ -124,17 +301,12 @@ class AlgoPressureToWeight:
             idx_trigger = self.idx_start
             self.idx_start = idx_trigger - self.cfg["feather_n"][0]
             self.idx_stop = idx_trigger + self.cfg["feather_n"][1]
-        if self.idx_start < 0:
-            self.idx_start = 0
-        if self.idx_stop >= len(self.dataset_p):
-            self.idx_stop = -1
+        self.idx_start = self.dataset_p.clamp(self.idx_start)
+        self.idx_stop = self.dataset_p.clamp(self.idx_stop)
 
-        if self.idx_start < 0:
-            self.idx_start = 0
-
-        seq_start = self.meta_info_p[self.idx_start][1]
-        seq_stop = self.meta_info_p[self.idx_stop][1]
-        self.sum_diff = self.dataset_p[self.idx_stop] - self.dataset_p[self.idx_start]
+        seq_start = self.dataset_p.seq(self.idx_start)
+        seq_stop = self.dataset_p.seq(self.idx_stop)
+        self.sum_diff = self.dataset_p.value(self.idx_stop) - self.dataset_p.value(self.idx_start)
         if self.dbg:
             print(f"window event - stop adj, {seq_start}, {seq_stop}, {self.sum_diff}, {self.inCalibration}, {self.calib_target}")
 
@@ -147,109 +319,80 @@ class AlgoPressureToWeight:
                 return True
         return False
 
-    def __update_params_skl(self):
-        data = self.dataset_fit
-        x = np.array([item[0] for item in data]).reshape(-1, 1)  # Features (x)
-        y = np.array([item[1] for item in data])  # Target (y)
-
-        model = LinearRegression()
-        self.model = model
-        model.fit(x, y)
-
-        y_pred = model.predict(x)
-
-        r_squared = model.score(x, y)
-
-        residuals = y - y_pred
-        n = len(y)
-        m = x.shape[1]
-        std_error = np.sqrt(np.sum(residuals**2) / (n - m - 1))
-        if self.dbg:
-            print(f"R²: {r_squared}")
-            print(f"Standard Error: {std_error}")
-            print(f"Coefficient (slope): {model.coef_}")
-            print(f"Intercept: {model.intercept_}")
-
-    def __update_params_spy(self):
-        data = self.dataset_fit
-        x = np.array([item[0] for item in data])
-        y = np.array([item[1] for item in data])
-        self.model = (slope, intercept, r_value, p_value, std_err) = linregress(x, y)
-        if self.dbg:
-            print("Slope:", slope)
-            print("Intercept:", intercept)
-            print("R-squared:", r_value**2)
-            print("Standard Error:", std_err)
     def __predict(self, data_in):
-        data_out = [self.model[0] * xi + self.model[1] for xi in data_in]
-
-        return data_out
+        return self.model.predict(data_in)
 
     def __updateDSFit(self):
-        vector = (abs(self.sum_diff), self.calib_target)
-        found = False
-        for i in range(len(self.dataset_fit)):
-            if (self.dataset_fit[i][1] == self.calib_target):
-                fea_in = (abs(self.sum_diff) + self.dataset_fit[i][0]) * 0.5
-                self.dataset_fit[i] = (fea_in, self.calib_target)
-                found = True
-                break
-        if not found:
-            self.dataset_fit.append(vector)
-
+        fitted = self.model.update(abs(self.sum_diff), self.calib_target)
         if self.dbg:
-            print(f"data points so far:{len(self.dataset_fit)}")
-        len_dps = len(self.dataset_fit)
-        if len_dps >= 2:
-            self.__update_params_spy()
-
-    def __truncDataBuf(self):
-        len_p = len(self.dataset_p)
-        if len_p > self.MAX_DATASET_LEN:
-            headroom = 100
-            if self.idx_start > headroom:
-                start = self.idx_start - headroom
-                self.idx_start = headroom
-                self.dataset_p = self.dataset_p[start:]
-                self.meta_info_p = self.meta_info_p[start:]
-            else:
-                pass
-
-    def updateData(self, sensorType:str, val:float, timestmap:datetime, seq:int = 0):
-        meta_info = (timestmap, seq)
+            print(f"data points so far:{len(self.model)}")
+            if fitted:
+                print("Slope:", self.model.slope)
+                print("Intercept:", self.model.intercept)
+                print("R-squared:", self.model.r_value**2)
+                print("Standard Error:", self.model.std_err)
+
+    def __trackNoise(self):
+        # only quiet samples (no open event, below the threshold) reach the
+        # estimator, it is reset whenever an event starts
+        if -1 == self.idx_start and self.noise.isFull():
+            alpha = self.cfg["noise_track_alpha"]
+            self.std_dev = (1 - alpha) * self.std_dev + alpha * self.noise.stdev()
+
+    def updateData(self, sensorType:str, val:float, t_ns:int, seq:int = 0):
+        """Feed one sample, `t_ns` is a monotonic timestamp in ns (see SampleClock)."""
         if sensorType[0] == 'p':
-            self.dataset_p.append(val)
-            self.meta_info_p.append(meta_info)
-            self.__truncDataBuf()
+            if self.cfg["auto_rate"]:
+                self.__checkRate(t_ns)
+            if self.decim_n > 1:
+                self.decim_sum += val
+                self.decim_cnt += 1
+                if self.decim_cnt < self.decim_n:
+                    return
+                val = self.decim_sum / self.decim_cnt
+                self.decim_sum = 0.0
+                self.decim_cnt = 0
+            val_raw = val
+            temperature = self.dataset_t.value(self.dataset_t.last) if len(self.dataset_t) > 0 else None
+            if self.cfg["temp_comp"] and temperature is not None:
+                val = self.tcomp.compensate(val, temperature)
+            if self.prefilter.enabled:
+                val = self.prefilter.update(val)
+            self.dataset_p.append(val, seq, t_ns)
+            if self.warm_check is not None:
+                self.__checkWarmStart(val)
         elif sensorType[0] == 't':
-            self.dataset_t.append(val)
-            self.meta_info_t.append(meta_info)
-            len_t = len(self.dataset_t)
-            if len_t > self.MAX_DATASET_LEN:
-                self.dataset_t = self.dataset_t[-self.MAX_DATASET_LEN:]
-                self.meta_info_t = self.meta_info_t[-self.MAX_DATASET_LEN:]
-                len_t = len(self.dataset_t)
+            self.dataset_t.append(val, seq, t_ns)
+            return
         else:
             return
 
         len_p = len(self.dataset_p)
+        idx_last = self.dataset_p.last
 
         if self.inCalibration and self.calib_target < 1e-6:
             #taring
-            if len_p >= self.stddev_sample_sz:
-                dataset_p = self.dataset_p[0 - self.stddev_sample_sz:]
-                self.std_dev = 0.8*self.std_dev + 0.2 * statistics.stdev(dataset_p)
+            self.noise.update(val)
+            if self.noise.isFull():
+                self.std_dev = 0.8*self.std_dev + 0.2 * self.noise.stdev()
                 if self.dbg:
                     print(f"stdev: {self.std_dev}")
         else:
+            diff = self.dataset_p.value(idx_last) - self.dataset_p.value(idx_last - 1) if len_p > 1 else 0.0
+            if abs(diff) <= self.cfg["thres_n"] * self.std_dev and (self.inCalibration or -1 == self.idx_start):
+                # only samples known not to trigger reach the noise estimate
+                self.noise.update(val)
+                if self.cfg["track_noise"] and not self.inCalibration:
+                    self.__trackNoise()
             if len_p > 1:
-                diff = self.dataset_p[len_p - 1] - self.dataset_p[len_p - 2]
                 if abs(diff) > self.cfg["thres_n"] * self.std_dev:
                     self.settle_hold_cnt = 0
                     if -1 == self.idx_start:
-                        self.idx_start = len_p - 1
-                        self.idx_stop = len_p - 1
+                        self.idx_start = idx_last
+                        self.idx_stop = idx_last
                         self.sum_diff = diff
+                        self.noise.reset()
+                        self.tcomp.breakSegment()
                         if self.dbg:
                             print(f'ev_start: {seq}, {val}, {self.cfg["thres_n"] * self.std_dev}')
                         self.__onWindowedEventStart()
@@ -261,6 +404,10 @@ class AlgoPressureToWeight:
                     else:
                         self.settle_hold_cnt += 1
                         if self.settle_hold_cnt >= self.cfg["settle_hold_dur"]:
-                            self.idx_stop = len_p - 1
+                            self.idx_stop = idx_last
                             self.__onWindowedEventStop()
 
+        # the fit only sees quiet samples, not the ones that triggered or belong to an event
+        if self.cfg["temp_comp"] and temperature is not None and -1 == self.idx_start:
+            self.tcomp.update(val_raw, temperature)
+
@@ -1,11 +1,14 @@
+import argparse
 import asyncio
 import json
-from datetime import datetime
-from bleak import BleakClient
-from BSTBLESensorClient import *
-from SensorMQTTClient import *
 from enum import Enum
-from AlgoPressureToWeight import *
+from BSTBLESensorClient import App3X_BLEClient, NiclaSenseME_BLEClient
+from NiclaFrameDecoder import NiclaFrameDecoder
+from SampleClock import CLOCK
+from CalibrationStore import CalibrationStore
+# NumPy (algorithm, binary logs), paho (SensorMQTTClient) and the logger are
+# imported where they are first needed, so --help and setups that do not use
+# them start without loading them; bleak is loaded by BleTransport only.
 
 class BSTSensorBoardType(Enum):
     APP3_X = "app3.x"
@@ -17,7 +20,7 @@ class App_BaroScale:
         "nicla": "app_baro_scale_nicla.json"
     }
 
-    def __init__(self, clientBoard:str, dbg = False):
+    def __init__(self, clientBoard:str, dbg = False, config:dict = None, mqtt_client = None, startLoop:bool = True):
         self.dbg = dbg
 
         if clientBoard == "app3.x":
@@ -28,17 +31,37 @@ class App_BaroScale:
             print(f"invalid board type: {clientBoard}")
             return
 
-        self.config = self.__load_config()
+        self.config = config if config is not None else self.__load_config()
         self.evCnt = 0
+        self.value_temp = float("nan")
         self.inCalibration = False
         self.calib_target = 0
-        self.algoPTW = AlgoPressureToWeight(dbg = dbg)
+        from AlgoPressureToWeight import AlgoPressureToWeight
+        self.algoPTW = AlgoPressureToWeight(dbg = dbg, cfg = self.config.get("algo_cfg"))
         self.algoPTW.subscribe(self.__cb_algo_event)
+        self.__setup_calib_store()
         self.__setup_misc()
-        self.__setup_msgn_client()
+        self.__setup_msgn_client(mqtt_client)
+        self.__setup_history()
         self.__setup_ble_client()
+        if startLoop:
+            try:
+                asyncio.run(self.run())     #run() flushes the batches and aggregates when the source stops
+            finally:
+                self.__tear_down()
         #end of function
 
+    async def run(self):
+        """Serve this board until cancelled, for use inside an existing event loop."""
+        try:
+            await self.ble_client.run()
+        finally:
+            if self.pressure_batcher is not None:
+                self.pressure_batcher.flush()
+            if self.pressure_aggregates is not None:
+                # publish the open windows, so none mixes samples from before and after a reconnect
+                self.pressure_aggregates.flush()
+
 
     def __load_config(self):
         """Load configuration from a JSON file."""
@@ -49,28 +72,79 @@ class App_BaroScale:
             return json.load(file)
 
     def __setup_misc(self):
+        self.log_file = None
+        self.log_binary = self.config.get("log_format", "csv") == "binary"
         # Only create log file if logging is enabled
         if self.config.get("log_data", False):
-            timestamp = datetime.now().strftime("%Y-%m-%d %H-%M-%S.%f")[:-3]
-            log_file_name = f"{timestamp}-{self.config['board_name']}.csv"
-            self.log_file = open(log_file_name, "w")
-            header = f"evt#, sensor, timestamp, in Calibration, Calibration Target, cnt, value"
-            self.log_file.write(header + "\n")
+            from SessionLogger import SessionLogger
+            if self.log_binary:
+                from BinarySampleLog import BinarySampleLog
+                self.encode_record = BinarySampleLog.encodeRecord
+                header = BinarySampleLog.encodeHeader(self.config["sensor_name"],
+                                                      CLOCK.anchor_wall_ns, CLOCK.anchor_mono_ns)
+                suffix = ".bsl"
+            else:
+                header = f"evt#, sensor, timestamp, in Calibration, Calibration Target, cnt, value" + "\n"
+                suffix = ".csv"
+            self.log_file = SessionLogger(
+                SessionLogger.timestamped(f"-{self.config['board_name']}{suffix}"),
+                header=header,
+                binary=self.log_binary,
+                batch_rows=self.config.get("log_batch_rows", 256),
+                flush_interval=self.config.get("log_flush_interval", 1.0),
+                rotate_bytes=self.config.get("log_rotate_bytes", 0),
+                compress=self.config.get("log_compress", True),
+                queue_len=self.config.get("log_queue_len", 10000),
+                dbg=self.dbg)
+    def __setup_calib_store(self):
+        self.calib_store = None
+        store_cfg = self.config.get("calibration_store", {})
+        if store_cfg.get("enabled", False):
+            self.calib_store = CalibrationStore(store_cfg.get("dir", "calibration"), dbg=self.dbg)
+            state = self.calib_store.load(self.config["mac_address"])
+            if state is not None:
+                self.algoPTW.warmStart(state)
+
+    def __save_calib(self):
+        if self.calib_store is None:
+            return
+        self.calib_store.saveLater(self.config["mac_address"], self.algoPTW.getCalibState())
+
+    def close(self):
+        """Flush and close the outputs, for owners running the app via run()."""
+        self.__tear_down()
+
     def __tear_down(self):
         if self.log_file:
             self.log_file.close()
-
-    def __publish_weight(self, weight, timestamp):
-        topic_data = "bstsn/" + self.config["mac_address"] + "/data/weight"
-        timestamp_str = timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        weight_data = {
-            "value":weight,
-            "timestamp": timestamp_str
-        }
-        self.mqtt_client.publish(topic_data, weight_data)
+        if self.pressure_batcher is not None:
+            self.pressure_batcher.close()
+        if self.pressure_aggregates is not None:
+            self.pressure_aggregates.close()
+        if self.calib_store is not None:
+            self.calib_store.close()
+
+    def __setup_history(self):
+        self.history_pressure = None
+        self.history_weight = None
+        history_cfg = self.config.get("history", {})
+        if history_cfg.get("enabled", False):
+            from HistoryServer import HistoryServer
+            server = HistoryServer.shared(history_cfg.get("http_port", 0), history_cfg.get("unix_socket"), dbg=self.dbg)
+            mac = self.config["mac_address"]
+            self.history_pressure = server.addSeries(mac, "pressure", history_cfg.get("capacity", 36000))
+            self.history_weight = server.addSeries(mac, "weight", history_cfg.get("events", 1000))
+            if history_cfg.get("mqtt", True):
+                server.attachMQTT(self.mqtt_client, mac)
+
+    def __publish_weight(self, weight, t_ns):
+        self.mqtt_client.publish_sample(self.topic_weight, weight, t_ns)
+        if self.history_weight is not None:
+            self.history_weight.append(t_ns, weight)
         
-    def __cb_algo_event(self, weight, timestamp):
-        self.__publish_weight(weight, timestamp)
+    def __cb_algo_event(self, weight, t_ns):
+        self.__publish_weight(weight, t_ns)
+        self.__save_calib()
 
     def __handler_calib_start(self, args:list = None)->int:
         self.inCalibration = True
@@ -81,51 +155,68 @@ class App_BaroScale:
     def __handler_calib_stop(self, args:list = None)->int:
         self.inCalibration = False
         self.algoPTW.updateCalibStatus(self.inCalibration, self.calib_target)
+        self.__save_calib()
         return 0
 
     def __handler_tare(self, args:list = None)->int:
         self.inCalibration = True
         self.calib_target = 0
         self.algoPTW.updateCalibStatus(self.inCalibration, self.calib_target)
-        self.__publish_weight(0, datetime.now())
+        self.__publish_weight(0, CLOCK.now())
         return 0
 
-    def __handle_data(self, sender, data, timestamp):
-        timestamp_str = timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        #timestamp_ms = int(timestamp.timestamp() * 1000)
-        self.evCnt += 1
+    def __handle_data(self, sender, data, t_ns):
         if (self.clientBoardType == BSTSensorBoardType.APP3_X):
             line = data.decode('utf-8')
             line_s = line.split(",")
             value_baro = float(line_s[-2].strip())
-            value_temp = float(line_s[-1].strip())
-            sensor_name = self.config["sensor_name"]
-            formatted_data = f"{self.evCnt}, {sensor_name}, {timestamp_str}, {self.inCalibration}, {self.calib_target}, {line}"
+            self.value_temp = float(line_s[-1].strip())
+            self.__handle_sample(value_baro, t_ns, line)
         elif (self.clientBoardType == BSTSensorBoardType.NICLA):
-            data = bytearray(data)
-            data[5] = 0  # Modify the byte array
-            (sid, sz, value) = struct.unpack("<BBI", data[0:6])
-            if (sid == 129):
-                value_baro = value * 0.0078125
-                sensor_name = self.config["sensor_name"]
-                formatted_data = f"{self.evCnt}, {sensor_name}, {timestamp_str}, {self.inCalibration}, {self.calib_target}, {self.evCnt}, {value_baro:.2f}" + "\n"
-
-        self.algoPTW.updateData('p', value_baro, timestamp, self.evCnt)
-
+            # a notification may carry several frames, temperature applies to the pressure samples after it
+            for frame in NiclaFrameDecoder.decode(data):
+                if frame.sid == NiclaFrameDecoder.SID_PRESSURE:
+                    self.__handle_sample(frame.value, t_ns)
+                elif frame.sid == NiclaFrameDecoder.SID_TEMPERATURE:
+                    self.value_temp = frame.value
+
+    def __format_sample(self, value_baro, t_ns, line = None):
+        sensor_name = self.config["sensor_name"]
+        timestamp_str = CLOCK.format(t_ns)
+        if line is not None:
+            return f"{self.evCnt}, {sensor_name}, {timestamp_str}, {self.inCalibration}, {self.calib_target}, {line}"
+        return f"{self.evCnt}, {sensor_name}, {timestamp_str}, {self.inCalibration}, {self.calib_target}, {self.evCnt}, {value_baro:.2f}" + "\n"
+
+    def __handle_sample(self, value_baro, t_ns, line = None):
+        self.evCnt += 1
+        if self.value_temp == self.value_temp:  #not NaN
+            self.algoPTW.updateData('t', self.value_temp, t_ns, self.evCnt)
+        self.algoPTW.updateData('p', value_baro, t_ns, self.evCnt)
+        if self.history_pressure is not None:
+            self.history_pressure.append(t_ns, value_baro)
+
+        # strings are only built for the outputs that need them
+        formatted_data = None
         if self.config["print_raw_data"]:
+            formatted_data = self.__format_sample(value_baro, t_ns, line)
             print(formatted_data, end="")
 
         if self.log_file:
-            self.log_file.write(formatted_data)
-            self.log_file.flush()
+            if self.log_binary:
+                self.log_file.write(self.encode_record(self.evCnt, t_ns, value_baro, self.value_temp,
+                                                       self.inCalibration, self.calib_target))
+            else:
+                if formatted_data is None:
+                    formatted_data = self.__format_sample(value_baro, t_ns, line)
+                self.log_file.write(formatted_data)
 
         if (self.config.get("publish_raw_ata", True)):
-            pressure_data = {
-                "value":value_baro,
-                "timestamp": timestamp_str
-            }
-            topic_data = "bstsn/" + self.config["mac_address"] + "/data/pressure"
-            self.mqtt_client.publish(topic_data, pressure_data)
+            if self.pressure_batcher is not None:
+                self.pressure_batcher.add(self.topic_pressure, t_ns, value_baro)
+            else:
+                self.mqtt_client.publish_sample(self.topic_pressure, value_baro, t_ns)
+        if self.pressure_aggregates is not None:
+            self.pressure_aggregates.add(self.topic_pressure, t_ns, value_baro)
 
 
     def __setup_ble_client(self):
@@ -135,7 +226,6 @@ class App_BaroScale:
             self.ble_client = NiclaSenseME_BLEClient(config=self.config, dbg=self.dbg)
         self.ble_client.configSensors()
         self.ble_client.subscribe(self.__handle_data)
-        self.ble_client.startListeningLoop()
 
 
     def __cb_mqtt_app_baro_scale(self, topic, payload):
@@ -144,11 +234,7 @@ class App_BaroScale:
         #topic:[nicla/44:4D/cmd]:
         #payload:[{"_payload":{"payload":{"command":"calibrate_start","arg1":503},,"socketid":"IEI2qi-67j9Ex3-dAAAD"}}]
 
-        cmd_handlers = {
-                "calibrate_start"   :{'cb':self.__handler_calib_start,   'num_args' : 1},
-                "calibrate_stop"    :{'cb':self.__handler_calib_stop,    'num_args' : 0},
-                "tare"              :{'cb':self.__handler_tare,          'num_args' : 0},
-                }
+        cmd_handlers = self.cmd_handlers
         try:
             # Attempt to parse the JSON message
             data = json.loads(payload)
@@ -175,27 +261,40 @@ class App_BaroScale:
         except Exception as e:
             print(f"Unexpected error: {e}")
 
-    def __setup_msgn_client(self):
-        hostname = self.config.get("mqtt_hostname", "localhost")
-        port = self.config.get("mqtt_port", 1883)
-        user = self.config.get("mqtt_user", None)
-        password = self.config.get("mqtt_password", None)
-        clientid = self.config.get("mqtt_client_id", None)
-        self.mqtt_client = SensorMQTTClient(
-            hostname=hostname,
-            port=port,
-            user=user,
-            password=password,
-            clientid=clientid)
+    def __setup_msgn_client(self, mqtt_client = None):
+        self.cmd_handlers = {
+                "calibrate_start"   :{'cb':self.__handler_calib_start,   'num_args' : 1},
+                "calibrate_stop"    :{'cb':self.__handler_calib_stop,    'num_args' : 0},
+                "tare"              :{'cb':self.__handler_tare,          'num_args' : 0},
+                }
+        self.topic_pressure = "bstsn/" + self.config["mac_address"] + "/data/pressure"
+        self.topic_weight = "bstsn/" + self.config["mac_address"] + "/data/weight"
+        if mqtt_client is not None:
+            # shared client, already started by its owner (see BaroScaleGateway)
+            self.mqtt_client = mqtt_client
+        else:
+            from SensorMQTTClient import SensorMQTTClient
+            self.mqtt_client = SensorMQTTClient.fromConfig(self.config)
+            self.mqtt_client.start()
+
+        self.pressure_batcher = None
+        batch_cfg = self.config.get("publish_batch", {})
+        if batch_cfg.get("enabled", False):
+            from MQTTPublishBatcher import MQTTPublishBatcher
+            self.pressure_batcher = MQTTPublishBatcher(
+                self.mqtt_client,
+                max_samples=batch_cfg.get("max_samples", 50),
+                max_latency_ms=batch_cfg.get("max_latency_ms", 500),
+                binary=batch_cfg.get("binary", False))
+
+        self.pressure_aggregates = None
+        agg_cfg = self.config.get("publish_aggregates", {})
+        if agg_cfg.get("enabled", False):
+            from MQTTAggregatePublisher import MQTTAggregatePublisher
+            self.pressure_aggregates = MQTTAggregatePublisher(self.mqtt_client, agg_cfg.get("windows_ms", [1000, 10000]))
 
         if self.mqtt_client is not None:
-            self.mqtt_client.start()
-            pressure_data = {
-                    "value":0,
-                    "timestamp": str(datetime.now())
-            }
-            topic_data = "bstsn/" + self.config["mac_address"] + "/data/pressure"
-            self.mqtt_client.publish(topic_data, pressure_data)
+            self.mqtt_client.publish_sample(self.topic_pressure, 0, CLOCK.now())
             #msg_pres_data = '{"value":' + str(baro) + ',' + '"timestamp":' + str(timestamp) + '}'
 
             #cmd = self.clientBoard + "/" + self.config["mac_address"] + "/cmd"
@@ -206,8 +305,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Connect to a BST Sensor Board via BLE")
     parser.add_argument("-b", "--board", choices=["nicla", "app3.x"], required=True, help="Specify the BLE board: 'nicla' or 'app3.x'")
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable debug mode")
+    parser.add_argument("-t", "--transport", choices=["ble", "serial", "replay", "synthetic"], help="Override the transport from the board config")
+    parser.add_argument("--source", help="Serial port (serial) or session log file (replay)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay/synthetic speed factor, 0 for as fast as possible")
 
     args = parser.parse_args()
 
-    app_baro_scale = App_BaroScale(clientBoard = args.board, dbg = args.verbose)
+    config = None
+    if args.transport:
+        with open(App_BaroScale.accepted_config_files[args.board], "r") as file:
+            config = json.load(file)
+        config["transport"] = {"type": args.transport, "port": args.source, "file": args.source, "speed": args.speed}
+
+    app_baro_scale = App_BaroScale(clientBoard = args.board, dbg = args.verbose, config = config)
 
@@ -1,19 +1,41 @@
 from abc import ABC, abstractmethod
 import json
-from datetime import datetime
-import struct
+import time
+import math
 import asyncio
-from bleak import BleakClient
 import argparse
+from NiclaFrameDecoder import NiclaFrameDecoder
+from SampleClock import CLOCK
+from BSTTransport import BSTTransport, createTransport
+from NotificationQueue import NotificationQueue
 
 
 class BSTBLESensorClient(ABC):
-    """Base class for BLE sensor clients."""
+    """Base class for BLE sensor clients.
 
-    def __init__(self, config:dict, dbg=False):
+    Notifications come from a BSTTransport: BLE by default, or the serial,
+    replay or synthetic transport selected by config["transport"].
+    With config["notify_queue"]["enabled"] the notification callback only
+    timestamps and queues them; a NotificationQueue worker thread does the
+    processing, so slow subscribers do not delay reception.
+    """
+
+    def __init__(self, config:dict, dbg=False, transport:BSTTransport = None):
         self.config = config
         self.dbg = dbg
         self.subscribers = []
+        self.transport = transport if transport is not None else createTransport(config, self.encodeSample, dbg)
+        self.queue = None
+        queue_cfg = config.get("notify_queue", {})
+        self.drain_timeout = queue_cfg.get("drain_timeout", 5.0)
+        if queue_cfg.get("enabled", False):
+            self.queue = NotificationQueue(
+                self.__dispatch,
+                max_len=queue_cfg.get("max_len", 1000),
+                batch=queue_cfg.get("batch", 32),
+                overflow=queue_cfg.get("overflow", "drop_oldest"),
+                name=f"NotificationQueue-{config.get('sensor_name', '')}",
+                dbg=dbg)
 
     @abstractmethod
     def configSensors(self):
@@ -21,7 +43,7 @@ class BSTBLESensorClient(ABC):
         pass
 
     def __handle_data(self, sender, data, timestamp):
-        """Handle the received data."""
+        """Handle the received data, `timestamp` is in time.monotonic_ns() (see SampleClock)."""
         if len(self.subscribers) > 0:
             for ss in self.subscribers:
                 ss(sender, data, timestamp)
@@ -33,35 +55,50 @@ class BSTBLESensorClient(ABC):
     def _handle_data_dft(self, sender, data, timestamp):
         pass
 
-    def __notification_handler(self, sender, data):
-        """Handle notifications from the BLE device."""
+    @staticmethod
+    @abstractmethod
+    def encodeSample(cnt:int, pressure:float, temperature:float) -> bytes:
+        """Build the notification the board would send for one sample."""
+        pass
+
+    def __dispatch(self, sender, data, timestamp):
         try:
-            timestamp = datetime.now()
             self.__handle_data(sender, data, timestamp)
         except UnicodeDecodeError:
             print(f"Decoding error for data: {data}")
 
-    async def __run(self):
-        async with BleakClient(self.config["mac_address"]) as client:
-            is_connected = await client.is_connected()
-            if self.dbg:
-                print(f"Connected: {is_connected}")
-
-            await client.start_notify(self.config["rx_uuid"], lambda sender, data: self.__notification_handler(sender, data))
-            print("Notifications started. Press Ctrl+C to stop.")
-
-            try:
-                while True:
-                    await asyncio.sleep(self.config["sleep_time"])
-            except KeyboardInterrupt:
-                print("Exiting program.")
-            finally:
-                await client.stop_notify(self.config["rx_uuid"])
-                print("Notifications stopped.")
-                
+    def __notification_handler(self, sender, data):
+        """Handle notifications from the BLE device."""
+        timestamp = time.monotonic_ns()
+        if self.queue is not None:
+            self.queue.put((sender, data, timestamp))
+        else:
+            self.__dispatch(sender, data, timestamp)
+
+    def injectNotification(self, sender, data):
+        """Feed a notification as if it came from the device (benchmarks, tests)."""
+        self.__notification_handler(sender, data)
+
+    async def run(self):
+        """Dispatch notifications from the transport until cancelled (or the source ends)."""
+        try:
+            await self.transport.run(self.__notification_handler)
+        finally:
+            if self.queue is not None:
+                # off the event loop, the other boards sharing it keep running meanwhile
+                await asyncio.get_running_loop().run_in_executor(None, self.drain, self.drain_timeout)
+
+    def drain(self, timeout:float = None) -> bool:
+        """Wait until queued notifications have been processed (no-op without a queue), False on timeout."""
+        if self.queue is not None:
+            return self.queue.join(timeout)
+        return True
+
+    def queueStats(self) -> dict:
+        return self.queue.stats() if self.queue is not None else {}
 
     def startListeningLoop(self):
-        asyncio.run(self.__run())
+        asyncio.run(self.run())
         
     def subscribe(self, cb):
         self.subscribers.append(cb)
@@ -70,52 +107,57 @@ class BSTBLESensorClient(ABC):
 class App3X_BLEClient(BSTBLESensorClient):
     """Implementation for App3X BLE Sensor Client."""
 
-    def __init__(self, config: dict, dbg=False):
-        super().__init__(config, dbg)
+    def __init__(self, config: dict, dbg=False, transport:BSTTransport = None):
+        super().__init__(config, dbg, transport)
 
     def configSensors(self):
         if self.dbg:
             print(f"[App3X_BLEClient] Configuring sensor...")
 
+    @staticmethod
+    def encodeSample(cnt:int, pressure:float, temperature:float) -> bytes:
+        return f"{cnt}, {pressure:.2f}, {temperature:.2f}\n".encode("utf-8")
+
     def _handle_data_dft(self, sender, data, timestamp):
+        if not self.config["print_raw_data"]:
+            return
+
         readstr = data.decode('utf-8')
         sensor_name = self.config["sensor_name"]
-        
-        timestamp_str = timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        formatted_data = f"{sensor_name}, {timestamp_str}, {readstr}"
-
-        if self.config["print_raw_data"]:
-            print(formatted_data)
+        print(f"{sensor_name}, {CLOCK.format(timestamp)}, {readstr}")
 
 
 class NiclaSenseME_BLEClient(BSTBLESensorClient):
     """Implementation for Nicla Sense ME BLE Sensor Client."""
 
-    def __init__(self, config: dict, dbg=False):
-        super().__init__(config, dbg)
+    def __init__(self, config: dict, dbg=False, transport:BSTTransport = None):
+        super().__init__(config, dbg, transport)
 
     def configSensors(self):
         if self.dbg:
             print(f"[NiclaSenseME_BLEClient] Configuring sensor...")
 
+    @staticmethod
+    def encodeSample(cnt:int, pressure:float, temperature:float) -> bytes:
+        data = NiclaFrameDecoder.encode(NiclaFrameDecoder.SID_PRESSURE, pressure)
+        if not math.isnan(temperature):
+            data = NiclaFrameDecoder.encode(NiclaFrameDecoder.SID_TEMPERATURE, temperature) + data
+        return data
+
     def _handle_data_dft(self, sender, data, timestamp):
         if self.dbg:
             print(f"data size: {len(data)}")
 
-        timestamp_str = timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        if 129 == data[0]:
-            data = bytearray(data)
-            data[5] = 0  # Modify the byte array
-            
-            (sid, sz, value) = struct.unpack("<BBI", data[0:6])
-            value = value * 0.078125
-            sensor_name = self.config["sensor_name"]
-            formatted_data = f"{sensor_name}, {timestamp_str}, {value:.2f}"
-        else:
+        if not self.config["print_raw_data"]:
             return
 
-        if self.config["print_raw_data"]:
-            print(formatted_data)
+        timestamp_str = CLOCK.format(timestamp)
+        sensor_name = self.config["sensor_name"]
+        for frame in NiclaFrameDecoder.decode(data):
+            if frame.sid == NiclaFrameDecoder.SID_PRESSURE:
+                print(f"{sensor_name}, {timestamp_str}, {frame.value:.2f}")
+            else:
+                print(f"{frame.name}, {timestamp_str}, {frame.value:.2f}")
 
 # Example Usage:
 if __name__ == "__main__":
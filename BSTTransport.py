@@ -0,0 +1,167 @@
+from abc import ABC, abstractmethod
+import asyncio
+import math
+import random
+import time
+
+
+class BSTTransport(ABC):
+    """Source of raw sensor notifications for a BSTBLESensorClient.
+
+    run() delivers every notification payload to `on_data(sender, data)` until
+    it is cancelled or, for finite sources, the data runs out. Transports that
+    generate payloads themselves use `encode(cnt, pressure, temperature)` of the
+    client so they produce exactly what the board would send.
+    """
+
+    def __init__(self, config:dict, encode = None, dbg = False):
+        self.config = config
+        self.encode = encode
+        self.dbg = dbg
+
+    @abstractmethod
+    async def run(self, on_data):
+        pass
+
+
+class BleTransport(BSTTransport):
+    """Notifications of the board's rx characteristic over BLE (bleak)."""
+
+    async def run(self, on_data):
+        from bleak import BleakClient
+
+        async with BleakClient(self.config["mac_address"]) as client:
+            is_connected = await client.is_connected()
+            if self.dbg:
+                print(f"Connected: {is_connected}")
+
+            await client.start_notify(self.config["rx_uuid"], lambda sender, data: on_data(sender, data))
+            print("Notifications started. Press Ctrl+C to stop.")
+
+            try:
+                while True:
+                    await asyncio.sleep(self.config["sleep_time"])
+            except KeyboardInterrupt:
+                print("Exiting program.")
+            finally:
+                await client.stop_notify(self.config["rx_uuid"])
+                print("Notifications stopped.")
+
+
+class SerialTransport(BSTTransport):
+    """Notifications forwarded by a UART bridge (pyserial).
+
+    In "line" mode every line is one notification (App3.x text output); in
+    "raw" mode whatever arrives within the read timeout is, up to `chunk` bytes.
+    """
+
+    async def run(self, on_data):
+        try:
+            import serial
+        except ImportError:
+            raise RuntimeError("serial transport needs pyserial (pip install pyserial)")
+
+        cfg = self.config["transport"]
+        port = cfg["port"]
+        line_mode = cfg.get("mode", "line") == "line"
+        chunk = cfg.get("chunk", 64)
+        loop = asyncio.get_running_loop()
+        with serial.Serial(port, cfg.get("baudrate", 115200), timeout=cfg.get("timeout", 0.1)) as ser:
+            if self.dbg:
+                print(f"Serial port {port} open")
+            read = ser.readline if line_mode else (lambda: ser.read(chunk))
+            while True:
+                data = await loop.run_in_executor(None, read)
+                if data:
+                    on_data(port, data)
+
+
+class ReplayTransport(BSTTransport):
+    """Re-sends the samples of a recorded session log (CSV or binary).
+
+    `speed` scales the recorded timing (2 = twice real time), 0 replays as fast
+    as possible. The run ends with the log.
+    """
+
+    YIELD_EVERY = 256
+
+    async def run(self, on_data):
+        from LogReplay import SessionLog
+
+        cfg = self.config["transport"]
+        file_name = cfg["file"]
+        speed = cfg.get("speed", 1.0)
+        log = SessionLog.load(file_name)
+        if self.dbg:
+            print(f"Replaying {len(log)} samples from {file_name}")
+
+        t_start = time.monotonic()
+        for idx in range(len(log)):
+            if speed > 0:
+                delay = (log.t_ns[idx] - log.t_ns[0]) / 1e9 / speed - (time.monotonic() - t_start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif idx % self.YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+            on_data(file_name, self.encode(int(log.seq[idx]), log.pressure[idx], log.temperature[idx]))
+
+
+class SyntheticScale:
+    """Pressure signal of a scale: noise plus a weight put on and taken off now and then."""
+
+    def __init__(self, noise:float = 0.5, step_every:int = 200, seed:int = 1):
+        self.rng = random.Random(seed)
+        self.noise = noise
+        self.step_every = step_every
+        self.cnt = 0
+        self.level = 101325.0
+        self.offset = 0.0
+
+    def next(self):
+        self.cnt += 1
+        if self.cnt % self.step_every == 0:
+            self.offset = 0.0 if self.offset else self.rng.choice([5.0, 15.0, 30.0])
+        temp = 25.0 + 0.5 * math.sin(self.cnt / 5000)
+        return self.level + self.offset + self.rng.gauss(0, self.noise), temp
+
+
+class SyntheticTransport(BSTTransport):
+    """Generated samples at `rate` Hz times `speed` (0: as fast as possible), `samples` = 0 runs forever."""
+
+    YIELD_EVERY = 256
+
+    async def run(self, on_data):
+        cfg = self.config["transport"]
+        rate = cfg.get("rate", 10)
+        speed = cfg.get("speed", 1.0)
+        samples = cfg.get("samples", 0)
+        scale = SyntheticScale(noise=cfg.get("noise", 0.5), seed=cfg.get("seed", 1))
+        period = 1.0 / (rate * speed) if rate > 0 and speed > 0 else 0
+
+        t_next = time.monotonic()
+        while samples == 0 or scale.cnt < samples:
+            if period:
+                t_next += period
+                delay = t_next - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif scale.cnt % self.YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+            (pressure, temp) = scale.next()
+            on_data("synthetic", self.encode(scale.cnt, pressure, temp))
+
+
+TRANSPORTS = {
+    "ble": BleTransport,
+    "serial": SerialTransport,
+    "replay": ReplayTransport,
+    "synthetic": SyntheticTransport,
+}
+
+
+def createTransport(config:dict, encode = None, dbg = False) -> BSTTransport:
+    """Create the transport selected by config["transport"]["type"] (default: ble)."""
+    transport_type = config.get("transport", {}).get("type", "ble")
+    if transport_type not in TRANSPORTS:
+        raise ValueError(f"invalid transport type: {transport_type}")
+    return TRANSPORTS[transport_type](config, encode, dbg)
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import argparse
+from App_Baroscale import App_BaroScale
+from SensorMQTTClient import SensorMQTTClient
+
+
+class BaroScaleGateway:
+    """Serve many scales from one process: one event loop, one MQTT connection.
+
+    The gateway config lists the boards to serve. Each entry names its board
+    type and board config file; any other keys in the entry override the values
+    from that file (e.g. "mac_address"). Every board gets its own
+    App_BaroScale (and with it its own AlgoPressureToWeight), all sharing the
+    gateway's SensorMQTTClient. With a "shards" block (or -w) the boards are
+    spread over worker processes instead, see ShardSupervisor.
+    """
+
+    def __init__(self, config_file:str = None, dbg = False, config:dict = None, mqtt_client = None):
+        self.dbg = dbg
+        if config is None:
+            with open(config_file, "r") as file:
+                config = json.load(file)
+        self.config = config
+
+        self.__setup_msgn_client(mqtt_client)
+        self.apps = []
+        for board in self.config["boards"]:
+            app = App_BaroScale(clientBoard=board["board"], dbg=dbg, config=self.loadBoardConfig(board),
+                                mqtt_client=self.mqtt_client, startLoop=False)
+            self.apps.append(app)
+
+    @staticmethod
+    def loadBoardConfig(board:dict) -> dict:
+        """Board config file of a `boards` entry, with the entry's own keys applied on top."""
+        board_type = board["board"]
+        config_file_name = board.get("config_file", App_BaroScale.accepted_config_files[board_type])
+        with open(config_file_name, "r") as file:
+            board_config = json.load(file)
+        board_config.update({k: v for k, v in board.items() if k not in ("board", "config_file")})
+        return board_config
+
+    def __setup_msgn_client(self, mqtt_client = None):
+        if mqtt_client is not None:
+            # owned by the caller (see ShardSupervisor)
+            self.mqtt_client = mqtt_client
+            return
+        self.mqtt_client = SensorMQTTClient.fromConfig(self.config, dbg=self.dbg)
+        self.mqtt_client.start()
+
+    async def __run_board(self, app:App_BaroScale):
+        """Keep one board connected; a failing board never takes the others down."""
+        reconnect_delay = self.config.get("reconnect_delay", 5)
+        while True:
+            try:
+                await app.run()
+                return  #finite source (replay, synthetic) ran out
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[{app.config['mac_address']}] connection lost: {e}, retrying in {reconnect_delay}s")
+            await asyncio.sleep(reconnect_delay)
+
+    async def run(self):
+        await asyncio.gather(*(self.__run_board(app) for app in self.apps))
+
+    def startListeningLoop(self):
+        try:
+            asyncio.run(self.run())
+        finally:
+            for app in self.apps:
+                app.close()
+            self.mqtt_client.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve several BST sensor boards from one process")
+    parser.add_argument("-c", "--config", default="app_baro_scale_gateway.json", help="Gateway config file listing the boards")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Enable debug mode")
+    parser.add_argument("-w", "--workers", type=int, help="Spread the boards over this many worker processes (overrides the \"shards\" block)")
+
+    args = parser.parse_args()
+
+    with open(args.config, "r") as file:
+        config = json.load(file)
+    shard_cfg = config.get("shards", {})
+    workers = args.workers if args.workers is not None else (shard_cfg.get("workers", 2) if shard_cfg.get("enabled", False) else 0)
+
+    if workers > 1:
+        from ShardSupervisor import ShardSupervisor
+        ShardSupervisor(config, workers=workers, dbg=args.verbose).startListeningLoop()
+    else:
+        gateway = BaroScaleGateway(config=config, dbg=args.verbose)
+        gateway.startListeningLoop()
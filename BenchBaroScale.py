@@ -0,0 +1,325 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+from collections import namedtuple
+from datetime import datetime
+from App_Baroscale import App_BaroScale
+from BSTTransport import SyntheticScale
+from MQTTPublishBatcher import MQTTPublishBatcher
+from NiclaFrameDecoder import NiclaSensorFrame
+from SampleClock import CLOCK
+from SampleColumns import SampleColumns
+from SampleRingBuffer import SampleRingBuffer
+
+
+class FakeMQTTClient:
+    """In-process stand-in for SensorMQTTClient.
+
+    Payloads are serialized like the real client would, but never sent. For
+    every sample that reaches a pressure topic (single or batched) the publish
+    time is recorded, so latencies can be matched against injection times.
+    The record is preallocated to keep it out of the memory measurements.
+    """
+
+    def __init__(self, capacity:int = 0):
+        self.subscribers = {}
+        self.published = 0
+        self.sample_pub_ns = array("q", bytes(8 * capacity))
+        self.n_samples = 0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def subscribe(self, topic, callback):
+        self.subscribers.setdefault(topic, []).append(callback)
+
+    def __record(self, topic, n_samples):
+        if "/data/pressure" in topic:
+            now = time.perf_counter_ns()
+            stop = min(self.n_samples + n_samples, len(self.sample_pub_ns))
+            for i in range(self.n_samples, stop):
+                self.sample_pub_ns[i] = now
+            self.n_samples += n_samples
+
+    def publish(self, topic, message):
+        json.dumps(message)
+        self.published += 1
+        self.__record(topic, len(message["samples"]) if "samples" in message else 1)
+
+    def publish_sample(self, topic, value, t_ns:int):
+        self.publish(topic, {"value": value, "timestamp": CLOCK.format(t_ns)})
+
+    def publish_raw(self, topic, payload:bytes):
+        self.published += 1
+        self.__record(topic, MQTTPublishBatcher.BINARY_HEADER.unpack_from(payload, 0)[1])
+
+
+SCENARIOS = {
+    "app3x-json":           {"board": "app3.x"},
+    "nicla-json":           {"board": "nicla"},
+    "nicla-batch":          {"board": "nicla", "publish_batch": {"enabled": True, "max_samples": 50, "max_latency_ms": 500}},
+    "nicla-batch-binary":   {"board": "nicla", "publish_batch": {"enabled": True, "max_samples": 50, "max_latency_ms": 500, "binary": True}},
+    "app3x-log-csv":        {"board": "app3.x", "log_data": True},
+    "nicla-log-binary":     {"board": "nicla", "log_data": True, "log_format": "binary"},
+    "nicla-queue":          {"board": "nicla", "notify_queue": {"enabled": True, "max_len": 100000, "batch": 32}},
+}
+
+
+def percentile(sorted_vals:list, pct:float):
+    if not sorted_vals:
+        return float("nan")
+    idx = min(len(sorted_vals) - 1, int(round(pct / 100 * (len(sorted_vals) - 1))))
+    return sorted_vals[idx]
+
+
+def makeApp(name:str, mqtt_client:FakeMQTTClient):
+    scenario = dict(SCENARIOS[name])
+    board = scenario.pop("board")
+    with open(App_BaroScale.accepted_config_files[board], "r") as file:
+        config = json.load(file)
+    config.update({"log_data": False, "print_raw_data": False, "publish_raw_ata": True, "publish_batch": {},
+                   "notify_queue": {}, "calibration_store": {}})
+    config.update(scenario)
+
+    app = App_BaroScale(clientBoard=board, config=config, mqtt_client=mqtt_client, startLoop=False)
+    # pre-fit the model so settled events run the prediction path
+    app.algoPTW.model.update(5.0, 50)
+    app.algoPTW.model.update(30.0, 300)
+    return app, board
+
+
+def drain(app):
+    app.ble_client.drain()
+    if app.pressure_batcher is not None:
+        app.pressure_batcher.flush()
+    if app.log_file:
+        app.log_file.close()
+
+
+def runScenario(name:str, samples:int, rate:float, measure_memory:bool = False):
+    mqtt_client = FakeMQTTClient(capacity=samples)
+    app, board = makeApp(name, mqtt_client)
+    scale = SyntheticScale()
+    encode = app.ble_client.encodeSample
+
+    def gen():
+        (pressure, temp) = scale.next()
+        return encode(scale.cnt, pressure, temp)
+
+    inject = app.ble_client.injectNotification
+
+    warmup = min(1000, samples // 10)
+    for _ in range(warmup):
+        inject(None, gen())
+    app.ble_client.drain()
+    mqtt_client.n_samples = 0
+
+    period_ns = int(1e9 / rate) if rate > 0 else 0
+    inject_ns = array("q", bytes(8 * samples))
+    callback_ns = array("q", bytes(8 * samples))
+    if measure_memory:
+        tracemalloc.start()
+        mem_start = tracemalloc.get_traced_memory()[0]
+
+    t_start = time.perf_counter_ns()
+    t_next = t_start
+    for i in range(samples):
+        data = gen()
+        if period_ns:
+            while time.perf_counter_ns() < t_next:
+                time.sleep(0)  # idle like a real receiver, lets worker threads run
+            t_next += period_ns
+        inject_ns[i] = time.perf_counter_ns()
+        inject(None, data)
+        callback_ns[i] = time.perf_counter_ns() - inject_ns[i]
+    drain(app)
+    elapsed = (time.perf_counter_ns() - t_start) / 1e9
+    if measure_memory:
+        mem_end = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+    result = {
+        "scenario": name,
+        "samples": samples,
+        "samples_per_s": samples / elapsed,
+        "published": mqtt_client.published,
+    }
+    if app.ble_client.queue is not None:
+        result["queue"] = app.ble_client.queueStats()
+    n_published = min(samples, mqtt_client.n_samples)
+    latencies = sorted((mqtt_client.sample_pub_ns[i] - inject_ns[i]) / 1e3 for i in range(n_published))
+    result["p50_us"] = percentile(latencies, 50)
+    result["p99_us"] = percentile(latencies, 99)
+    # time the notification callback blocks reception
+    callbacks = sorted(c / 1e3 for c in callback_ns)
+    result["callback_p99_us"] = percentile(callbacks, 99)
+    if measure_memory:
+        result["mem_growth_bytes_per_ksample"] = (mem_end - mem_start) * 1000 / samples
+    return result
+
+
+def footprint(build, n:int) -> float:
+    """Bytes per sample held by the structure `build(n)` returns."""
+    tracemalloc.start()
+    mem_start = tracemalloc.get_traced_memory()[0]
+    held = build(n)
+    mem_end = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return (mem_end - mem_start) / n
+
+
+def buildTupleHistory(n):
+    # per-sample (datetime, seq) meta tuples next to a list of boxed floats
+    meta = [(datetime.now(), i) for i in range(n)]
+    values = [101325.0 + i * 0.01 for i in range(n)]
+    return meta, values
+
+
+def buildRingHistory(n):
+    buf = SampleRingBuffer(n)
+    for i in range(n):
+        buf.append(101325.0 + i * 0.01, i, time.monotonic_ns())
+    return buf
+
+
+def buildTupleBatch(n):
+    return [(time.monotonic_ns(), 101325.0 + i * 0.01) for i in range(n)]
+
+
+def buildColumnBatch(n):
+    batch = SampleColumns()
+    for i in range(n):
+        batch.append(time.monotonic_ns(), 101325.0 + i * 0.01)
+    return batch
+
+
+NamedTupleFrame = namedtuple("NamedTupleFrame", ["sid", "name", "value"])
+
+
+def buildNamedTupleFrames(n):
+    return [NamedTupleFrame(129, "pressure", 101325.0 + i * 0.01) for i in range(n)]
+
+
+def buildSlotsFrames(n):
+    return [NiclaSensorFrame(129, "pressure", 101325.0 + i * 0.01) for i in range(n)]
+
+
+FOOTPRINTS = [
+    ("history", "tuple(datetime, seq) + float", buildTupleHistory),
+    ("history", "SampleRingBuffer", buildRingHistory),
+    ("batch", "list of (t_ns, value) tuples", buildTupleBatch),
+    ("batch", "SampleColumns", buildColumnBatch),
+    ("frames", "NamedTuple", buildNamedTupleFrames),
+    ("frames", "__slots__ NiclaSensorFrame", buildSlotsFrames),
+]
+
+
+# module: heavy dependencies that must not be loaded just by importing it
+IMPORT_CHECKS = {
+    "App_Baroscale": ("numpy", "paho", "bleak", "scipy"),
+    "BSTBLESensorClient": ("numpy", "paho", "bleak", "scipy"),
+    "BaroScaleGateway": ("numpy", "bleak", "scipy"),
+}
+
+
+def measureImport(module:str, heavy:tuple, runs:int = 3) -> dict:
+    """Import `module` in fresh interpreters, return the best time and the heavy modules it loaded."""
+    code = ("import json, sys, time\n"
+            "t_start = time.perf_counter()\n"
+            f"import {module}\n"
+            "ms = (time.perf_counter() - t_start) * 1000\n"
+            f"print(json.dumps({{'ms': ms, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))")
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        if best is None or result["ms"] < best["ms"]:
+            best = result
+    return best
+
+
+def runImportChecks(budget_ms:float) -> list:
+    results = []
+    for module, heavy in IMPORT_CHECKS.items():
+        result = measureImport(module, heavy)
+        result["module"] = module
+        result["ok"] = result["ms"] <= budget_ms and not result["loaded"]
+        results.append(result)
+        loaded = ", ".join(result["loaded"]) or "-"
+        print(f"{module:20s} {result['ms']:7.1f} ms  heavy loaded: {loaded:20s} {'ok' if result['ok'] else 'FAIL'}")
+    return results
+
+
+def runFootprints(samples:int) -> list:
+    results = []
+    for (stage, name, build) in FOOTPRINTS:
+        bytes_per_sample = footprint(build, samples)
+        results.append({"stage": stage, "representation": name, "bytes_per_sample": bytes_per_sample})
+        print(f"{stage:8s} {name:32s} {bytes_per_sample:8.1f} B/sample")
+    return results
+
+
+def runScenarios(names:list, samples:int, rate:float, memory:bool = False) -> list:
+    results = []
+    # log scenarios write files, keep them out of the working tree
+    with tempfile.TemporaryDirectory() as work_dir:
+        cwd = os.getcwd()
+        config_dir = os.path.dirname(os.path.abspath(__file__))
+        os.chdir(work_dir)
+        App_BaroScale.accepted_config_files = {k: os.path.join(config_dir, v)
+                                               for k, v in App_BaroScale.accepted_config_files.items()}
+        try:
+            for name in names:
+                result = runScenario(name, samples, rate)
+                if memory:
+                    result["mem_growth_bytes_per_ksample"] = runScenario(
+                        name, samples, rate, measure_memory=True)["mem_growth_bytes_per_ksample"]
+                results.append(result)
+                line = (f"{name:20s} {result['samples_per_s']:10.0f} samples/s  "
+                        f"p50 {result['p50_us']:8.1f} us  p99 {result['p99_us']:8.1f} us  "
+                        f"callback p99 {result['callback_p99_us']:6.1f} us")
+                if memory:
+                    line += f"  mem {result['mem_growth_bytes_per_ksample']:8.0f} B/ksample"
+                print(line)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and latency benchmark of the baro scale sample pipeline")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS), help="Scenario(s) to run (default: all)")
+    parser.add_argument("-n", "--samples", type=int, default=20000, help="Samples per scenario")
+    parser.add_argument("-r", "--rate", type=float, default=0, help="Notification rate in Hz (0: as fast as possible)")
+    parser.add_argument("-m", "--memory", action="store_true", help="Also measure memory growth (extra run with tracemalloc)")
+    parser.add_argument("-f", "--footprint", action="store_true", help="Compare bytes per sample of the sample representations instead")
+    parser.add_argument("-i", "--import-time", action="store_true", help="Check import times and lazy loading of heavy dependencies instead")
+    parser.add_argument("--budget-ms", type=float, default=150, help="Import time budget per module for -i")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+
+    args = parser.parse_args()
+
+    if args.import_time:
+        results = runImportChecks(args.budget_ms)
+    elif args.footprint:
+        results = runFootprints(args.samples)
+    else:
+        results = runScenarios(args.scenario or list(SCENARIOS), args.samples, args.rate, args.memory)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+
+    if args.import_time and not all(r["ok"] for r in results):
+        sys.exit(1)
@@ -0,0 +1,115 @@
+import argparse
+import gzip
+import os
+import struct
+import numpy as np
+
+
+class BinarySampleLog:
+    """Compact fixed-width sample log, memory-mapped into a NumPy structured array.
+
+    Layout: one HEADER followed by RECORD_DTYPE records (32 bytes each). Record
+    timestamps are monotonic nanoseconds; the header carries the wall-clock time
+    of one monotonic instant so they can be mapped back to wall-clock time.
+    """
+
+    MAGIC = b"BSBL"
+    VERSION = 1
+    EXTENSIONS = (".bsl", ".bsl.gz")
+    # magic, version, record size, anchor wall ns, anchor monotonic ns, sensor name, reserved
+    HEADER = struct.Struct("<4sHHqq16s8x")
+    RECORD = struct.Struct("<qdIffB3x")
+    RECORD_DTYPE = np.dtype({
+        "names": ["t_ns", "pressure", "seq", "temperature", "calib_target", "in_calib"],
+        "formats": ["<i8", "<f8", "<u4", "<f4", "<f4", "u1"],
+        "offsets": [0, 8, 16, 20, 24, 28],
+        "itemsize": 32,
+    })
+
+    def __init__(self, file_name:str):
+        self.file_name = file_name
+        if file_name.endswith(".gz"):
+            # rotated logs are gzipped and cannot be mapped, decompress into memory
+            with gzip.open(file_name, "rb") as file:
+                buf = file.read()
+            self.__parse_header(buf[:self.HEADER.size])
+            n = (len(buf) - self.HEADER.size) // self.RECORD.size
+            self.records = np.frombuffer(buf, dtype=self.RECORD_DTYPE, count=n, offset=self.HEADER.size)
+        else:
+            with open(file_name, "rb") as file:
+                self.__parse_header(file.read(self.HEADER.size))
+            n = (os.path.getsize(file_name) - self.HEADER.size) // self.RECORD.size
+            if n > 0:
+                self.records = np.memmap(file_name, dtype=self.RECORD_DTYPE, mode="r",
+                                         offset=self.HEADER.size, shape=(n,))
+            else:
+                self.records = np.empty(0, dtype=self.RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __parse_header(self, buf:bytes):
+        if len(buf) < self.HEADER.size:
+            raise ValueError(f"{self.file_name}: truncated header")
+        (magic, version, record_size, self.anchor_wall_ns, self.anchor_mono_ns, sensor) = self.HEADER.unpack(buf)
+        if magic != self.MAGIC or record_size != self.RECORD.size:
+            raise ValueError(f"{self.file_name}: not a binary sample log (v{self.VERSION})")
+        self.version = version
+        self.sensor = sensor.rstrip(b"\0").decode("utf-8")
+
+    @classmethod
+    def encodeHeader(cls, sensor:str, anchor_wall_ns:int, anchor_mono_ns:int) -> bytes:
+        return cls.HEADER.pack(cls.MAGIC, cls.VERSION, cls.RECORD.size,
+                               anchor_wall_ns, anchor_mono_ns, sensor.encode("utf-8")[:16])
+
+    @classmethod
+    def encodeRecord(cls, seq:int, t_ns:int, pressure:float, temperature:float,
+                     in_calib:bool, calib_target:float) -> bytes:
+        return cls.RECORD.pack(t_ns, pressure, seq & 0xFFFFFFFF, temperature, calib_target, in_calib)
+
+    def wall_ns(self):
+        """Wall-clock nanoseconds since the epoch for every record."""
+        return self.records["t_ns"] - self.anchor_mono_ns + self.anchor_wall_ns
+
+    def toSessionLog(self):
+        from LogReplay import SessionLog
+        return SessionLog(self.sensor, self.wall_ns(), self.records["pressure"], self.records["temperature"],
+                          self.records["in_calib"].astype(bool), self.records["calib_target"], self.records["seq"])
+
+
+def convertCsv(csv_name:str, out_name:str = None) -> str:
+    """Convert a session CSV written by App_BaroScale into a binary sample log."""
+    from LogReplay import SessionLog
+    log = SessionLog.load(csv_name)
+    if out_name is None:
+        out_name = os.path.splitext(csv_name)[0] + ".bsl"
+
+    records = np.zeros(len(log), dtype=BinarySampleLog.RECORD_DTYPE)
+    anchor_wall_ns = int(log.t_ns[0]) if len(log) else 0
+    records["t_ns"] = log.t_ns - anchor_wall_ns
+    records["pressure"] = log.pressure
+    records["seq"] = log.seq
+    records["temperature"] = log.temperature
+    records["calib_target"] = log.calib_target
+    records["in_calib"] = log.in_calib
+
+    with open(out_name, "wb") as file:
+        file.write(BinarySampleLog.encodeHeader(log.sensor, anchor_wall_ns, 0))
+        records.tofile(file)
+    return out_name
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert and inspect binary baro scale sample logs")
+    parser.add_argument("files", nargs="+", help="session CSV files to convert, or .bsl files to inspect")
+    parser.add_argument("-o", "--output", help="Output file name (single input only)")
+
+    args = parser.parse_args()
+
+    for file_name in args.files:
+        if file_name.endswith(BinarySampleLog.EXTENSIONS):
+            log = BinarySampleLog(file_name)
+            print(f"{file_name}: {log.sensor}, {len(log)} records, v{log.version}")
+        else:
+            out_name = convertCsv(file_name, args.output if len(args.files) == 1 else None)
+            print(f"{file_name} -> {out_name}")
@@ -0,0 +1,86 @@
+import math
+import numpy as np
+
+
+class CalibrationModel:
+    """Linear pressure-difference to weight model kept as running sufficient statistics.
+
+    One calibration point is held per target weight. Adding a point for a known
+    target replaces the old point in the sums (n, Σx, Σy, Σxy, Σx², Σy²), so every
+    update and refit is O(1) and no regression library is needed.
+    """
+
+    def __init__(self):
+        self.points = {}
+        self.n = 0
+        self.sx = 0.0
+        self.sy = 0.0
+        self.sxy = 0.0
+        self.sxx = 0.0
+        self.syy = 0.0
+        self.slope = 0.0
+        self.intercept = 0.0
+        self.r_value = 0.0
+        self.std_err = 0.0
+        self.fitted = False
+
+    def __len__(self):
+        return self.n
+
+    def __accumulate(self, x:float, y:float, sign:int):
+        self.n += sign
+        self.sx += sign * x
+        self.sy += sign * y
+        self.sxy += sign * x * y
+        self.sxx += sign * x * x
+        self.syy += sign * y * y
+
+    def update(self, x:float, target:float):
+        """Add the point (x, target); a repeated target averages with its previous x."""
+        x = float(x)
+        target = float(target)
+        if target in self.points:
+            x_old = self.points[target]
+            self.__accumulate(x_old, target, -1)
+            x = (x + x_old) * 0.5
+        self.points[target] = x
+        self.__accumulate(x, target, 1)
+        return self.fit()
+
+    def fit(self):
+        """Refit from the running sums, returns True if the model is usable."""
+        n = self.n
+        if n < 2:
+            return self.fitted
+        ssx = n * self.sxx - self.sx * self.sx
+        ssy = n * self.syy - self.sy * self.sy
+        ssxy = n * self.sxy - self.sx * self.sy
+        if ssx <= 0:
+            return self.fitted  #all points share one x, keep the previous fit
+
+        self.slope = ssxy / ssx
+        self.intercept = (self.sy - self.slope * self.sx) / n
+        if ssy > 0:
+            self.r_value = max(-1.0, min(1.0, ssxy / math.sqrt(ssx * ssy)))
+        else:
+            self.r_value = 0.0
+        if n > 2:
+            self.std_err = math.sqrt(max(0.0, (1 - self.r_value ** 2) * ssy / ssx / (n - 2)))
+        else:
+            self.std_err = 0.0
+        self.fitted = True
+        return True
+
+    def predict(self, x):
+        """Predict weights for a scalar or an array of pressure differences."""
+        return self.slope * np.asarray(x, dtype=np.float64) + self.intercept
+
+    def toDict(self) -> dict:
+        return {"points": [[target, x] for target, x in self.points.items()]}
+
+    @classmethod
+    def fromDict(cls, state:dict):
+        model = cls()
+        for target, x in state.get("points", []):
+            model.update(x, target)
+        return model
@@ -0,0 +1,97 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class CalibrationStore:
+    """Calibration state of every board, one JSON file per MAC address.
+
+    save() writes a temporary file next to the target and renames it over the
+    old one, so a crash mid-write leaves the previous state intact.
+    saveLater() hands the state to a writer thread instead, so the sample path
+    never waits for the disk; states queued for a board before the writer got
+    to it are replaced by the latest one. Pending states are written on
+    close(), which also runs at interpreter exit.
+    """
+
+    VERSION = 1
+
+    def __init__(self, directory:str = "calibration", dbg:bool = False):
+        self.directory = directory
+        self.dbg = dbg
+        self.pending = {}
+        self.cond = threading.Condition()
+        self.closed = False
+        self.writer = None
+
+    def path(self, mac_address:str) -> str:
+        return os.path.join(self.directory, f"calib-{mac_address.replace(':', '').lower()}.json")
+
+    def save(self, mac_address:str, state:dict):
+        os.makedirs(self.directory, exist_ok=True)
+        record = {"version": self.VERSION, "mac_address": mac_address, "saved_at": time.time(), "state": state}
+        fd, tmp_name = tempfile.mkstemp(prefix=".calib-", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(record, file, indent=4)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_name, self.path(mac_address))
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        if self.dbg:
+            print(f"[CalibrationStore] saved {self.path(mac_address)}")
+
+    def saveLater(self, mac_address:str, state:dict):
+        with self.cond:
+            if self.closed:
+                return
+            self.pending[mac_address] = state
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.__write_loop, name="CalibrationStore", daemon=True)
+                self.writer.start()
+                atexit.register(self.close)
+            self.cond.notify()
+
+    def __write_loop(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending or self.closed)
+                if not self.pending:
+                    return
+                (mac_address, state) = self.pending.popitem()
+            try:
+                self.save(mac_address, state)
+            except OSError as e:
+                print(f"Error: could not save calibration state - {e}")
+
+    def close(self):
+        """Write the pending states and stop the writer thread."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        if self.writer is not None and self.writer is not threading.current_thread():
+            self.writer.join()
+
+    def load(self, mac_address:str):
+        """Return the saved state, or None if there is none (or it is unreadable)."""
+        file_name = self.path(mac_address)
+        try:
+            with open(file_name, "r") as file:
+                record = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"[CalibrationStore] ignoring {file_name}: {e}")
+            return None
+        if record.get("version") != self.VERSION:
+            print(f"[CalibrationStore] ignoring {file_name}: version {record.get('version')}")
+            return None
+        if self.dbg:
+            age = time.time() - record.get("saved_at", 0)
+            print(f"[CalibrationStore] loaded {file_name}, saved {age:.0f}s ago")
+        return record["state"]
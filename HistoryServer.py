@@ -0,0 +1,183 @@
+import json
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+from SampleClock import CLOCK
+from SampleHistory import SampleHistory
+
+
+class HistoryServer:
+    """Answers time-range queries on the SampleHistory series of the boards in this process.
+
+    Queries are dicts with "board" (MAC address), "series" ("pressure" or
+    "weight"), a time range given as "from"/"to" (epoch ms), "last" (seconds
+    before the newest sample) or "around" (epoch ms) with "span" (seconds,
+    default 60), and optionally "max_points". The answer has the samples as
+    `[[timestamp_ms, value], ...]`, like MQTTPublishBatcher's JSON batches.
+
+    They are served over HTTP on localhost (`GET /history?board=...&last=60`,
+    `GET /boards`), optionally on a UNIX socket instead, and over MQTT, where
+    a request on `bstsn/<mac>/history/request` is answered on its "reply_to"
+    topic or `bstsn/<mac>/history/response`, echoing its "id". One server is
+    shared by all boards of a process, see shared().
+    """
+
+    DEFAULT_SPAN_S = 60
+    MAX_POINTS = 10000
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, http_port:int = 0, unix_socket:str = None, dbg = False):
+        self.dbg = dbg
+        self.series = {}
+        self.httpd = None
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            self.httpd = _UnixHTTPServer(unix_socket, _HistoryRequestHandler)
+        elif http_port:
+            self.httpd = ThreadingHTTPServer(("127.0.0.1", http_port), _HistoryRequestHandler)
+        if self.httpd is not None:
+            self.httpd.history = self
+            threading.Thread(target=self.httpd.serve_forever, name="HistoryServer", daemon=True).start()
+
+    @classmethod
+    def shared(cls, http_port:int = 0, unix_socket:str = None, dbg = False):
+        """The process-wide server for this endpoint, created on first use."""
+        key = (http_port, unix_socket)
+        with cls._shared_lock:
+            server = cls._shared.get(key)
+            if server is None:
+                try:
+                    server = cls(http_port, unix_socket, dbg)
+                except OSError as e:
+                    # e.g. the port is taken by another shard worker, MQTT queries still work
+                    print(f"Error: history endpoint not available - {e}")
+                    server = cls(dbg=dbg)
+                cls._shared[key] = server
+            return server
+
+    def addSeries(self, board:str, name:str, capacity:int) -> SampleHistory:
+        history = SampleHistory(capacity)
+        self.series.setdefault(board, {})[name] = history
+        return history
+
+    def attachMQTT(self, mqtt_client, board:str):
+        """Answer this board's history requests over MQTT."""
+        topic_response = f"bstsn/{board}/history/response"
+
+        def on_request(topic, payload):
+            try:
+                request = json.loads(payload)
+            except ValueError as e:
+                request = None
+                response = {"error": str(e)}
+            if not isinstance(request, dict):
+                if request is not None:
+                    response = {"error": "request must be a JSON object"}
+                request = {}
+            else:
+                try:
+                    response = self.query(dict(request, board=board))
+                except KeyError as e:
+                    response = {"error": f"unknown board or series {e}"}
+                except (ValueError, TypeError) as e:
+                    response = {"error": str(e)}
+            if "id" in request:
+                response["id"] = request["id"]
+            reply_to = request.get("reply_to")
+            mqtt_client.publish(reply_to if isinstance(reply_to, str) and reply_to else topic_response, response)
+
+        mqtt_client.subscribe(f"bstsn/{board}/history/request", on_request)
+
+    def boards(self) -> dict:
+        boards = {}
+        for board, series in self.series.items():
+            boards[board] = {}
+            for name, history in series.items():
+                span = history.span()
+                boards[board][name] = {
+                    "count": len(history),
+                    "from": CLOCK.epoch_ms(span[0]) if span else None,
+                    "to": CLOCK.epoch_ms(span[1]) if span else None,
+                }
+        return {"boards": boards}
+
+    def query(self, request:dict) -> dict:
+        """Run a query, raises KeyError for unknown boards or series and ValueError for bad ranges."""
+        board = request["board"]
+        name = request.get("series", "pressure")
+        history = self.series[board][name]
+        span = history.span()
+        if span is None:
+            return {"board": board, "series": name, "samples": []}
+
+        if "around" in request:
+            half_ms = float(request.get("span", self.DEFAULT_SPAN_S)) * 500
+            t_from = self.__mono_ns(float(request["around"]) - half_ms)
+            t_to = self.__mono_ns(float(request["around"]) + half_ms)
+        elif "last" in request:
+            t_to = span[1]
+            t_from = t_to - int(float(request["last"]) * 1e9)
+        else:
+            t_from = self.__mono_ns(float(request["from"])) if "from" in request else span[0]
+            t_to = self.__mono_ns(float(request["to"])) if "to" in request else span[1]
+        if t_to < t_from:
+            raise ValueError("empty time range")
+
+        max_points = min(int(request.get("max_points", self.MAX_POINTS)), self.MAX_POINTS)
+        samples = history.range(t_from, t_to, max_points)
+        return {
+            "board": board,
+            "series": name,
+            "samples": [[CLOCK.epoch_ms(t_ns), value] for t_ns, value in samples],
+        }
+
+    @staticmethod
+    def __mono_ns(epoch_ms:float) -> int:
+        return int(epoch_ms * 1e6) - CLOCK.anchor_wall_ns + CLOCK.anchor_mono_ns
+
+    def close(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _HistoryRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        history = self.server.history
+        try:
+            if url.path == "/boards":
+                self.__reply(200, history.boards())
+            elif url.path == "/history":
+                self.__reply(200, history.query(dict(parse_qsl(url.query))))
+            else:
+                self.__reply(404, {"error": f"unknown path {url.path}"})
+        except KeyError as e:
+            self.__reply(404, {"error": f"unknown board or series {e}"})
+        except (ValueError, TypeError) as e:
+            self.__reply(400, {"error": str(e)})
+
+    def __reply(self, status:int, body:dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        return str(self.client_address or "unix")
+
+    def log_message(self, format, *args):
+        if self.server.history.dbg:
+            super().log_message(format, *args)
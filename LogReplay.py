@@ -0,0 +1,182 @@
+import argparse
+import time
+from datetime import datetime
+import numpy as np
+from AlgoPressureToWeight import AlgoPressureToWeight
+from BinarySampleLog import BinarySampleLog
+from SampleClock import SampleClock
+
+
+class SessionLog:
+    """Columnar view of a session log written by App_BaroScale.
+
+    CSV rows look like `evt#, sensor, timestamp, in Calibration, Calibration Target, ...`
+    followed by the raw App3.x line (`cnt, pressure, temperature`) or, for Nicla
+    boards, `cnt, pressure`. Binary logs are read through BinarySampleLog.
+    Timestamps are kept as wall-clock ns since the epoch in `t_ns`, so `clock`
+    (a SampleClock anchored at 0) formats them.
+    """
+
+    clock = SampleClock(0, 0)
+
+    def __init__(self, sensor:str = "", t_ns = None, pressure = None,
+                 temperature = None, in_calib = None, calib_target = None, seq = None):
+        self.sensor = sensor
+        self.t_ns = np.asarray(t_ns if t_ns is not None else [], dtype=np.int64)
+        self.seq = np.asarray(seq if seq is not None else [], dtype=np.int64)
+        self.pressure = np.asarray(pressure if pressure is not None else [], dtype=np.float64)
+        self.temperature = np.asarray(temperature if temperature is not None else [], dtype=np.float64)
+        self.in_calib = np.asarray(in_calib if in_calib is not None else [], dtype=bool)
+        self.calib_target = np.asarray(calib_target if calib_target is not None else [], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.pressure)
+
+    @classmethod
+    def load(cls, file_name:str):
+        if file_name.endswith(BinarySampleLog.EXTENSIONS):
+            return BinarySampleLog(file_name).toSessionLog()
+
+        sensor = ""
+        seq = []
+        t_ns = []
+        pressure = []
+        temperature = []
+        in_calib = []
+        calib_target = []
+        with open(file_name, "r") as file:
+            for line in file:
+                cols = [c.strip() for c in line.split(",")]
+                if len(cols) < 7 or not cols[0].isdigit():
+                    continue    #header or truncated row
+                seq.append(int(cols[0]))
+                sensor = cols[1]
+                t_ns.append(int(datetime.fromisoformat(cols[2]).timestamp() * 1e6) * 1000)
+                in_calib.append(cols[3] == "True")
+                calib_target.append(float(cols[4]))
+                payload = cols[5:]
+                if len(payload) >= 3:
+                    pressure.append(float(payload[-2]))
+                    temperature.append(float(payload[-1]))
+                else:
+                    pressure.append(float(payload[-1]))
+                    temperature.append(np.nan)
+        return cls(sensor, t_ns, pressure, temperature, in_calib, calib_target, seq)
+
+    def segments(self):
+        """Yield (start, stop, in_calib, calib_target) for runs of constant calibration state."""
+        n = len(self)
+        if n == 0:
+            return
+        state_change = (np.diff(self.in_calib.astype(np.int8)) != 0) | (np.diff(self.calib_target) != 0)
+        bounds = np.concatenate(([0], np.flatnonzero(state_change) + 1, [n]))
+        for i in range(len(bounds) - 1):
+            start = int(bounds[i])
+            stop = int(bounds[i + 1])
+            yield start, stop, bool(self.in_calib[start]), float(self.calib_target[start])
+
+
+class LogReplay:
+    """Streams a SessionLog through AlgoPressureToWeight faster than real time."""
+
+    def __init__(self, algo:AlgoPressureToWeight = None, dbg:bool = False):
+        self.dbg = dbg
+        self.algo = algo if algo is not None else AlgoPressureToWeight(dbg=dbg)
+        self.algo.subscribe(self.__cb_algo_event)
+        self.events = []
+
+    def __cb_algo_event(self, weight, t_ns):
+        self.events.append((t_ns, float(weight)))
+
+    def __feed(self, log:SessionLog, idx:int, filtered = None):
+        temperature = log.temperature[idx]
+        if temperature == temperature:  #not NaN
+            self.algo.updateData('t', temperature, log.t_ns[idx], log.seq[idx])
+        self.algo.updateData('p', log.pressure[idx], log.t_ns[idx], log.seq[idx])
+        if filtered is not None and self.algo.prefilter.enabled:
+            # keep what the detection saw as look-back for the next batch
+            filtered[idx] = self.algo.dataset_p.value(self.algo.dataset_p.last)
+
+    def runStreaming(self, log:SessionLog):
+        """Feed every sample through updateData, exactly like the live BLE path."""
+        for start, stop, in_calib, target in log.segments():
+            self.algo.updateCalibStatus(in_calib, target)
+            for idx in range(start, stop):
+                self.__feed(log, idx)
+        return self.events
+
+    def runVectorized(self, log:SessionLog):
+        """Like runStreaming, but outside calibration detect events with detectEventsBatch.
+
+        Calibration segments (taring, fitting) and any event still open when a
+        segment starts are streamed sample by sample; the rest of each segment is
+        handled in one vectorized pass with the std_dev in effect at that point.
+        With temperature compensation or decimation enabled every sample is
+        streamed, since the values seen by the detection depend on running state.
+        """
+        if self.algo.cfg["temp_comp"] or self.algo.cfg["decimate_to"]:
+            return self.runStreaming(log)
+        lookback = max(self.algo.cfg["feather_p"][0], self.algo.cfg["feather_n"][0])
+        # pressure as the detection sees it, i.e. after the pre-filter
+        pressure = log.pressure.copy() if self.algo.prefilter.enabled else log.pressure
+        for start, stop, in_calib, target in log.segments():
+            self.algo.updateCalibStatus(in_calib, target)
+            idx = start
+            if in_calib:
+                while idx < stop:
+                    self.__feed(log, idx, pressure)
+                    idx += 1
+                continue
+
+            while idx < stop and self.algo.isEventOpen():
+                self.__feed(log, idx, pressure)
+                idx += 1
+            if idx >= stop:
+                continue
+
+            if self.algo.prefilter.enabled:
+                pressure[idx:stop] = self.algo.prefilterBatch(log.pressure[idx:stop])
+            base = max(0, idx - lookback)
+            idx_start, idx_stop, sum_diff = self.algo.detectEventsBatch(pressure[base:stop], idx - base)
+            for i in range(len(sum_diff)):
+                self.algo.onBatchEvent(sum_diff[i], int(log.t_ns[base + idx_stop[i]]))
+        return self.events
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded baro scale session logs through AlgoPressureToWeight")
+    parser.add_argument("logs", nargs="+", help="session CSV files written by App_BaroScale")
+    parser.add_argument("--vectorized", action="store_true", help="Use the NumPy event detection outside calibration")
+    parser.add_argument("-o", "--output", help="Write weight events as CSV to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Enable debug mode")
+
+    args = parser.parse_args()
+
+    out = open(args.output, "w") if args.output else None
+    if out:
+        out.write("log, timestamp, weight\n")
+
+    for file_name in args.logs:
+        log = SessionLog.load(file_name)
+        replay = LogReplay(dbg=args.verbose)
+        t_start = time.perf_counter()
+        if args.vectorized:
+            events = replay.runVectorized(log)
+        else:
+            events = replay.runStreaming(log)
+        elapsed = time.perf_counter() - t_start
+
+        for t_ns, weight in events:
+            timestamp_str = SessionLog.clock.format(t_ns)
+            row = f"{file_name}, {timestamp_str}, {weight:.2f}"
+            if out:
+                out.write(row + "\n")
+            else:
+                print(row)
+
+        duration = (log.t_ns[-1] - log.t_ns[0]) / 1e9 if len(log) > 1 else 0
+        speedup = duration / elapsed if elapsed > 0 else 0
+        print(f"{file_name}: {len(log)} samples, {len(events)} events, {elapsed:.3f}s ({speedup:.0f}x real time)")
+
+    if out:
+        out.close()
@@ -0,0 +1,71 @@
+from SampleClock import CLOCK
+from OnlineStats import WindowStats
+
+
+class MQTTAggregatePublisher:
+    """Publishes min/max/mean/stddev of a sample stream over fixed time windows.
+
+    Every window length in `windows_ms` gives one downsampled stream on
+    `<topic>/agg/<length>` (e.g. `bstsn/<mac>/data/pressure/agg/1s`), so a
+    dashboard can subscribe at the resolution it draws instead of to every
+    raw sample. Windows are aligned to wall-clock multiples of their length
+    and are published when the first sample of a later window arrives, as
+    `{"timestamp", "window_ms", "count", "min", "max", "mean", "stddev"}` with
+    the start of the window as timestamp.
+    """
+
+    def __init__(self, mqtt_client, windows_ms:list = (1000, 10000)):
+        self.mqtt_client = mqtt_client
+        self.windows_ms = sorted(set(int(w) for w in windows_ms if w > 0))
+        self.streams = {}
+
+    @staticmethod
+    def label(window_ms:int) -> str:
+        return f"{window_ms / 1000:g}s" if window_ms % 1000 == 0 else f"{window_ms}ms"
+
+    def __stream(self, topic:str) -> list:
+        # per window length: [topic, window_ms, current window index, stats]
+        stream = [[f"{topic}/agg/{self.label(w)}", w, None, WindowStats()] for w in self.windows_ms]
+        self.streams[topic] = stream
+        return stream
+
+    def add(self, topic:str, t_ns:int, value:float):
+        stream = self.streams.get(topic)
+        if stream is None:
+            stream = self.__stream(topic)
+        wall_ms = CLOCK.epoch_ms(t_ns)
+        for window in stream:
+            index = wall_ms // window[1]
+            if index != window[2]:
+                if window[2] is not None:
+                    self.__publish(window)
+                window[2] = index
+            window[3].update(value)
+
+    def __publish(self, window:list):
+        (topic, window_ms, index, stats) = window
+        if stats.n == 0:
+            return
+        start_ms = index * window_ms
+        # window start as a monotonic timestamp, for the usual timestamp format
+        t_start = start_ms * 1_000_000 - CLOCK.anchor_wall_ns + CLOCK.anchor_mono_ns
+        self.mqtt_client.publish(topic, {
+            "timestamp": CLOCK.format(t_start),
+            "window_ms": window_ms,
+            "count": stats.n,
+            "min": stats.min,
+            "max": stats.max,
+            "mean": stats.mean,
+            "stddev": stats.stdev(),
+        })
+        stats.reset()
+
+    def flush(self):
+        """Publish the windows still open, e.g. when the stream ends."""
+        for stream in self.streams.values():
+            for window in stream:
+                self.__publish(window)
+                window[2] = None
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,115 @@
+import struct
+import threading
+import time
+from SampleClock import CLOCK
+from SampleColumns import SampleColumns
+
+
+class MQTTPublishBatcher:
+    """Coalesces per-sample (timestamp, value) publishes into one message per topic.
+
+    Samples added for a topic are sent together on `<topic>/batch` once
+    `max_samples` are pending or `max_latency_ms` after the first one arrived,
+    whichever comes first. Payloads are JSON, `{"samples": [[timestamp_ms, value], ...]}`,
+    or with `binary` set a BINARY_HEADER (format version, count, first timestamp
+    in ms) followed by `count` BINARY_SAMPLE entries (ms offset from the first
+    timestamp, value). One flusher thread per batcher sends the batches whose
+    latency deadline has passed.
+    """
+
+    BINARY_VERSION = 1
+    BINARY_HEADER = struct.Struct("<BHq")
+    BINARY_SAMPLE = struct.Struct("<Id")
+
+    def __init__(self, mqtt_client, max_samples:int = 50, max_latency_ms:int = 500, binary:bool = False):
+        self.mqtt_client = mqtt_client
+        self.max_samples = max(1, int(max_samples))
+        self.max_latency_ms = max_latency_ms
+        self.binary = binary
+        self.pending = {}
+        self.deadlines = {}
+        self.cond = threading.Condition()
+        self.flusher = None
+        self.closed = False
+
+    def add(self, topic:str, t_ns:int, value:float):
+        """Queue a sample, `t_ns` is a monotonic timestamp (converted to epoch ms on send)."""
+        with self.cond:
+            samples = self.pending.get(topic)
+            if samples is None:
+                samples = self.pending[topic] = SampleColumns()
+            samples.append(t_ns, value)
+            if len(samples) >= self.max_samples:
+                batch = self.__take(topic)
+            else:
+                batch = None
+                if len(samples) == 1 and self.max_latency_ms and not self.closed:
+                    self.deadlines[topic] = time.monotonic() + self.max_latency_ms / 1000
+                    if self.flusher is None:
+                        self.flusher = threading.Thread(target=self.__flush_loop, name="MQTTPublishBatcher", daemon=True)
+                        self.flusher.start()
+                    self.cond.notify()
+        if batch:
+            self.__publish(topic, batch)
+
+    def flush(self, topic:str = None):
+        """Send pending samples now, for one topic or for all of them."""
+        with self.cond:
+            topics = [topic] if topic is not None else list(self.pending)
+            batches = [(t, self.__take(t)) for t in topics]
+        for t, batch in batches:
+            if batch:
+                self.__publish(t, batch)
+
+    def close(self):
+        self.flush()
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def __flush_loop(self):
+        while True:
+            with self.cond:
+                while True:
+                    if self.closed:
+                        return
+                    now = time.monotonic()
+                    due = [t for t, deadline in self.deadlines.items() if deadline <= now]
+                    if due:
+                        break
+                    self.cond.wait(min(self.deadlines.values()) - now if self.deadlines else None)
+                batches = [(t, self.__take(t)) for t in due]
+            for t, batch in batches:
+                if batch:
+                    self.__publish(t, batch)
+
+    def __take(self, topic:str):
+        self.deadlines.pop(topic, None)
+        return self.pending.pop(topic, None)
+
+    def encode(self, batch:SampleColumns):
+        epoch_ms = CLOCK.epoch_ms
+        if not self.binary:
+            return {"samples": [[epoch_ms(t_ns), value] for t_ns, value in batch]}
+        t0 = epoch_ms(batch.t_ns[0])
+        payload = bytearray(self.BINARY_HEADER.size + len(batch) * self.BINARY_SAMPLE.size)
+        self.BINARY_HEADER.pack_into(payload, 0, self.BINARY_VERSION, len(batch), t0)
+        offset = self.BINARY_HEADER.size
+        for t_ns, value in batch:
+            self.BINARY_SAMPLE.pack_into(payload, offset, epoch_ms(t_ns) - t0, value)
+            offset += self.BINARY_SAMPLE.size
+        return bytes(payload)
+
+    @classmethod
+    def decodeBinary(cls, payload:bytes):
+        """Inverse of the binary encoding, returns [(timestamp_ms, value), ...]."""
+        (version, count, t0) = cls.BINARY_HEADER.unpack_from(payload, 0)
+        return [(t0 + dt, value) for dt, value in
+                cls.BINARY_SAMPLE.iter_unpack(payload[cls.BINARY_HEADER.size:cls.BINARY_HEADER.size + count * cls.BINARY_SAMPLE.size])]
+
+    def __publish(self, topic:str, batch:SampleColumns):
+        payload = self.encode(batch)
+        if self.binary:
+            self.mqtt_client.publish_raw(topic + "/batch", payload)
+        else:
+            self.mqtt_client.publish(topic + "/batch", payload)
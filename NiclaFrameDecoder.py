@@ -0,0 +1,82 @@
+import struct
+
+
+class NiclaSensorFrame:
+    """One decoded sensor frame; __slots__ keep it to three references, no dict."""
+
+    __slots__ = ("sid", "name", "value")
+
+    def __init__(self, sid:int, name:str, value:float):
+        self.sid = sid
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        return f"NiclaSensorFrame(sid={self.sid}, name={self.name!r}, value={self.value})"
+
+
+class NiclaFrameDecoder:
+    """Decoder for Nicla Sense ME notifications.
+
+    A notification packs one or more BHI260 sensor frames back to back, each
+    `sensor id (u8), payload size (u8), payload`. Frames are decoded in place
+    from a memoryview with precompiled structs; unknown sensor ids are skipped
+    using their size byte.
+    """
+
+    SID_TEMPERATURE = 128
+    SID_PRESSURE = 129
+    SID_HUMIDITY = 130
+    SID_GAS = 131
+
+    FRAME_HEADER = struct.Struct("<BB")
+    U24 = struct.Struct("<HB")
+
+    # sid: (name, payload struct, scale)
+    SENSORS = {
+        SID_TEMPERATURE:    ("temperature", struct.Struct("<h"), 0.01),         # degC
+        SID_PRESSURE:       ("pressure",    U24,                 0.0078125),    # Pa (1/128)
+        SID_HUMIDITY:       ("humidity",    struct.Struct("<B"), 1.0),          # %rH
+        SID_GAS:            ("gas",         struct.Struct("<I"), 1.0),          # Ohm
+    }
+
+    @classmethod
+    def decode(cls, data) -> list:
+        """Decode every sensor frame in a notification into NiclaSensorFrame records."""
+        frames = []
+        mv = memoryview(data)
+        n = len(mv)
+        offset = 0
+        header_sz = cls.FRAME_HEADER.size
+        while offset + header_sz <= n:
+            (sid, sz) = cls.FRAME_HEADER.unpack_from(mv, offset)
+            if sid == 0:
+                break   #padding
+            payload = offset + header_sz
+            offset = payload + sz
+            if offset > n:
+                break   #truncated frame
+            sensor = cls.SENSORS.get(sid)
+            if sensor is None:
+                continue
+            (name, fmt, scale) = sensor
+            if sz < fmt.size:
+                continue
+            if fmt is cls.U24:
+                (lo, hi) = fmt.unpack_from(mv, payload)
+                raw = lo | (hi << 16)
+            else:
+                raw = fmt.unpack_from(mv, payload)[0]
+            frames.append(NiclaSensorFrame(sid, name, raw * scale))
+        return frames
+
+    @classmethod
+    def encode(cls, sid:int, value:float) -> bytes:
+        """Build a single frame, the inverse of decode() (used for replay and tests)."""
+        (name, fmt, scale) = cls.SENSORS[sid]
+        raw = int(round(value / scale))
+        if fmt is cls.U24:
+            payload = fmt.pack(raw & 0xFFFF, (raw >> 16) & 0xFF)
+        else:
+            payload = fmt.pack(raw)
+        return cls.FRAME_HEADER.pack(sid, len(payload)) + payload
@@ -0,0 +1,111 @@
+import threading
+from collections import deque
+
+
+class NotificationQueue:
+    """Bounded hand-off from the notification callback to a worker thread.
+
+    put() only stores the (already timestamped) notification and returns, so
+    reception never waits for decoding, the algorithm, logging or publishing.
+    The worker takes up to `batch` items at a time and calls `handler(*item)`
+    for each. When `max_len` items are pending the `overflow` policy applies:
+    "drop_oldest" discards the oldest pending item, "drop_newest" the incoming
+    one. Dropped items are counted in `dropped`. There is no blocking policy:
+    notifications are queued from the asyncio event loop, where waiting for
+    room would stall every board served by it.
+    """
+
+    OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+
+    def __init__(self, handler, max_len:int = 1000, batch:int = 32, overflow:str = "drop_oldest",
+                 name:str = "NotificationQueue", dbg:bool = False):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"invalid overflow policy: {overflow}")
+        self.handler = handler
+        self.max_len = max(1, int(max_len))
+        self.batch = max(1, int(batch))
+        self.overflow = overflow
+        self.name = name
+        self.dbg = dbg
+
+        self.items = deque()
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.busy = 0
+
+        self.cond = threading.Condition()
+        self.stopping = False
+        self.thread = threading.Thread(target=self.__run, name=name, daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item:tuple) -> bool:
+        """Queue an item for the worker, returns False if it (or an older item) was dropped."""
+        with self.cond:
+            self.received += 1
+            ok = True
+            if len(self.items) >= self.max_len:
+                if self.overflow == "drop_oldest":
+                    self.items.popleft()
+                    self.dropped += 1
+                    ok = False
+                else:
+                    self.dropped += 1
+                    return False
+            self.items.append(item)
+            depth = len(self.items)
+            if depth > self.max_depth:
+                self.max_depth = depth
+            if depth == 1:
+                self.cond.notify_all()
+            return ok
+
+    def join(self, timeout:float = None) -> bool:
+        """Wait until every queued item has been handled, returns False on timeout."""
+        with self.cond:
+            self.cond.notify_all()
+            return self.cond.wait_for(lambda: not self.items and not self.busy, timeout)
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self.items),
+            "max_depth": self.max_depth,
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+        }
+
+    def close(self):
+        """Handle what is still queued, then stop the worker."""
+        if self.stopping:
+            return
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        self.thread.join()
+        if self.dbg or self.dropped:
+            print(f"[{self.name}] {self.processed} processed, {self.dropped} dropped, max depth {self.max_depth}")
+
+    def __run(self):
+        items = self.items
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: items or self.stopping)
+                if not items and self.stopping:
+                    return
+                batch = [items.popleft() for _ in range(min(self.batch, len(items)))]
+                self.busy = len(batch)
+                self.cond.notify_all()
+            for item in batch:
+                try:
+                    self.handler(*item)
+                except Exception as e:
+                    print(f"[{self.name}] handler failed: {e}")
+            with self.cond:
+                self.processed += len(batch)
+                self.busy = 0
+                self.cond.notify_all()
@@ -0,0 +1,130 @@
+import math
+from collections import deque
+
+
+class SlidingWindowVariance:
+    """Sample variance over the last `window` values, updated in O(1).
+
+    Uses Welford's update for a fixed-size window: every new value replaces the
+    oldest one in the running mean and sum of squared deviations. The sums are
+    recomputed from the window now and then to keep rounding error from
+    accumulating on long-running streams.
+    """
+
+    RESYNC_PERIOD = 100
+
+    def __init__(self, window:int):
+        self.window = int(window)
+        self.values = deque(maxlen=self.window)
+        self.reset()
+
+    def reset(self):
+        self.values.clear()
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.n_updates = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def isFull(self):
+        return len(self.values) == self.window
+
+    def update(self, val:float):
+        val = float(val)
+        n = len(self.values)
+        if n < self.window:
+            self.values.append(val)
+            delta = val - self.mean
+            self.mean += delta / (n + 1)
+            self.m2 += delta * (val - self.mean)
+        else:
+            old = self.values[0]
+            self.values.append(val)
+            mean_old = self.mean
+            self.mean += (val - old) / n
+            self.m2 += (val - old) * (val - self.mean + old - mean_old)
+            if self.m2 < 0:
+                self.m2 = 0.0
+
+        self.n_updates += 1
+        if self.n_updates >= self.RESYNC_PERIOD * self.window:
+            self.__resync()
+
+    def __resync(self):
+        n = len(self.values)
+        self.mean = math.fsum(self.values) / n
+        self.m2 = math.fsum((v - self.mean) ** 2 for v in self.values)
+        self.n_updates = 0
+
+    def variance(self):
+        n = len(self.values)
+        if n < 2:
+            return 0.0
+        return self.m2 / (n - 1)
+
+    def stdev(self):
+        return math.sqrt(self.variance())
+
+
+class SampleRateEstimator:
+    """Sample rate in Hz from the timestamps (ns) of the last `window` samples.
+
+    The rate is taken over the span of the whole window instead of single
+    intervals, so bursts (several samples of one BLE notification sharing a
+    timestamp) average out.
+    """
+
+    def __init__(self, window:int = 64):
+        self.window = max(2, int(window))
+        self.timestamps = deque(maxlen=self.window)
+        self.n_updates = 0
+
+    def reset(self):
+        self.timestamps.clear()
+        self.n_updates = 0
+
+    def update(self, t_ns:int):
+        self.timestamps.append(t_ns)
+        self.n_updates += 1
+
+    def rate(self):
+        """Samples per second, None until the window is full."""
+        if len(self.timestamps) < self.window:
+            return None
+        span = self.timestamps[-1] - self.timestamps[0]
+        if span <= 0:
+            return None
+        return (len(self.timestamps) - 1) * 1e9 / span
+
+
+class WindowStats:
+    """Count, mean, standard deviation, min and max of the values added since the last reset().
+
+    Welford's update, so a window of any length costs O(1) memory.
+    """
+
+    __slots__ = ("n", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, val:float):
+        self.n += 1
+        delta = val - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (val - self.mean)
+        if val < self.min:
+            self.min = val
+        if val > self.max:
+            self.max = val
+
+    def stdev(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
@@ -0,0 +1,202 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from AlgoPressureToWeight import AlgoPressureToWeight
+from LogReplay import LogReplay, SessionLog
+
+
+class ParamSweep:
+    """Grid or random search of AlgoPressureToWeight parameters over recorded sessions.
+
+    Every configuration is replayed over every log on a process pool and scored
+    against the calibration targets in the logs: the calibration points a
+    session collects are predicted leave-one-out (fit on the others, predict
+    the held-out target), and calibration segments where no placement was
+    detected count as misses. Lower scores are better:
+    score = mean relative error + miss rate. Logs with fewer than MIN_TARGETS
+    distinct calibration targets cannot be scored leave-one-out and are left
+    out (see `skipped`); configurations that collect no scorable points on
+    any log get no score and are listed after the ranked ones.
+    """
+
+    MIN_TARGETS = 3
+
+    DEFAULT_GRID = {
+        "thres_n": [2, 3, 4, 5],
+        "settle_hold_dur": [10, 15, 20],
+        "feather_p": [(3, 10), (5, 14), (8, 18)],
+        "feather_n": [(4, 2), (6, 3), (8, 5)],
+        "error_tor": [0.10],
+        "MAX_DATASET_LEN": [200],
+    }
+
+    def __init__(self, log_files:list, grid:dict = None, workers:int = None, vectorized:bool = True):
+        self.log_files = []
+        self.skipped = []
+        for file_name in log_files:
+            n_targets = len(self.calibrationTargets(SessionLog.load(file_name)))
+            if n_targets < self.MIN_TARGETS:
+                self.skipped.append((file_name, n_targets))
+            else:
+                self.log_files.append(file_name)
+        self.grid = {k: [tuple(v) if isinstance(v, list) else v for v in values]
+                     for k, values in (grid or self.DEFAULT_GRID).items()}
+        self.workers = workers or os.cpu_count()
+        self.vectorized = vectorized
+
+    @staticmethod
+    def calibrationTargets(log:SessionLog) -> set:
+        return {target for _, _, in_calib, target in log.segments() if in_calib and target > 0}
+
+    def gridConfigs(self) -> list:
+        keys = list(self.grid)
+        return [dict(zip(keys, values)) for values in itertools.product(*(self.grid[k] for k in keys))]
+
+    def randomConfigs(self, n:int, seed:int = 0) -> list:
+        rng = random.Random(seed)
+        seen = set()
+        configs = []
+        # cap at the grid size, there are no more distinct configurations
+        n = min(n, int(np.prod([len(v) for v in self.grid.values()])))
+        while len(configs) < n:
+            params = {k: rng.choice(values) for k, values in self.grid.items()}
+            key = tuple(params.values())
+            if key not in seen:
+                seen.add(key)
+                configs.append(params)
+        return configs
+
+    def run(self, configs:list) -> list:
+        """Score every configuration, returns the results ranked best first, unscored ones last."""
+        chunksize = max(1, len(configs) // (self.workers * 4))
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.log_files, self.vectorized)) as pool:
+            results = list(pool.map(_score_worker, configs, chunksize=chunksize))
+        ranked = sorted((r for r in results if r["score"] is not None), key=lambda r: r["score"])
+        for rank, result in enumerate(ranked, 1):
+            result["rank"] = rank
+        unscored = [r for r in results if r["score"] is None]
+        for result in unscored:
+            result["rank"] = None
+        return ranked + unscored
+
+
+def scoreSession(log:SessionLog, params:dict, vectorized:bool = True) -> dict:
+    """Replay one log with `params`, return its leave-one-out errors and misses."""
+    cfg = {k: v for k, v in params.items() if k != "MAX_DATASET_LEN"}
+    algo = AlgoPressureToWeight(dbg=False, cfg=cfg, maxDatasetLen=params.get("MAX_DATASET_LEN", 200))
+    replay = LogReplay(algo)
+    events = replay.runVectorized(log) if vectorized else replay.runStreaming(log)
+
+    t_events = np.array([t for t, _ in events], dtype=np.int64)
+    w_events = np.array([w for _, w in events])
+    segments = 0
+    missed = 0
+    for start, stop, in_calib, target in log.segments():
+        if not in_calib or target <= 0:
+            continue
+        segments += 1
+        in_seg = (t_events >= log.t_ns[start]) & (t_events <= log.t_ns[stop - 1])
+        if not np.any(in_seg & (w_events == target)):
+            missed += 1
+
+    errors = []
+    targets = []
+    xs = np.array(list(algo.model.points.values()))
+    ys = np.array(list(algo.model.points.keys()))
+    for i in range(len(xs)):
+        others = np.arange(len(xs)) != i
+        if np.count_nonzero(others) < 2 or np.ptp(xs[others]) == 0:
+            continue
+        slope, intercept = np.polyfit(xs[others], ys[others], 1)
+        errors.append(float(slope * xs[i] + intercept - ys[i]))
+        targets.append(float(ys[i]))
+    return {"errors": errors, "targets": targets, "segments": segments, "missed": missed}
+
+
+_worker_logs = []
+_worker_vectorized = True
+
+
+def _init_worker(log_files:list, vectorized:bool):
+    global _worker_logs, _worker_vectorized
+    _worker_logs = [SessionLog.load(f) for f in log_files]
+    _worker_vectorized = vectorized
+
+
+def _score_worker(params:dict) -> dict:
+    errors = []
+    rel_errors = []
+    segments = 0
+    missed = 0
+    for log in _worker_logs:
+        session = scoreSession(log, params, _worker_vectorized)
+        segments += session["segments"]
+        missed += session["missed"]
+        errors += session["errors"]
+        rel_errors += [abs(e) / y for e, y in zip(session["errors"], session["targets"]) if y > 0]
+
+    # without points there is nothing to compare, the configuration stays unranked
+    miss_rate = missed / segments if segments else 1.0
+    mre = float(np.mean(rel_errors)) if rel_errors else None
+    return {
+        "params": params,
+        "score": mre + miss_rate if mre is not None else None,
+        "mean_rel_error": mre,
+        "rmse": float(np.sqrt(np.mean(np.square(errors)))) if errors else None,
+        "points": len(errors),
+        "missed": missed,
+        "segments": segments,
+    }
+
+
+def formatParams(params:dict) -> str:
+    return " ".join(f"{k}={v}" for k, v in params.items())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune AlgoPressureToWeight parameters over recorded session logs")
+    parser.add_argument("logs", nargs="+", help="session logs (CSV or binary) with calibration segments")
+    parser.add_argument("-g", "--grid", help="JSON file mapping parameter names to lists of values")
+    parser.add_argument("-r", "--random", type=int, default=0, help="Random search over N configurations of the grid instead of the full grid")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random search")
+    parser.add_argument("-j", "--workers", type=int, help="Worker processes (default: all cores)")
+    parser.add_argument("--streaming", action="store_true", help="Replay sample by sample instead of the vectorized detection")
+    parser.add_argument("-k", "--top", type=int, default=10, help="Number of configurations to print")
+    parser.add_argument("-o", "--output", help="Write the full ranked report as JSON to this file")
+
+    args = parser.parse_args()
+
+    grid = None
+    if args.grid:
+        with open(args.grid, "r") as file:
+            grid = json.load(file)
+
+    sweep = ParamSweep(args.logs, grid=grid, workers=args.workers, vectorized=not args.streaming)
+    for file_name, n_targets in sweep.skipped:
+        print(f"skipping {file_name}: {n_targets} calibration targets, leave-one-out needs {ParamSweep.MIN_TARGETS}")
+    if not sweep.log_files:
+        parser.exit(1, "no log with enough calibration targets to score\n")
+    configs = sweep.randomConfigs(args.random, args.seed) if args.random else sweep.gridConfigs()
+
+    t_start = time.perf_counter()
+    results = sweep.run(configs)
+    elapsed = time.perf_counter() - t_start
+
+    ranked = [r for r in results if r["rank"] is not None]
+    print(f"{len(configs)} configurations x {len(sweep.log_files)} logs on {sweep.workers} workers in {elapsed:.1f}s")
+    for result in ranked[:args.top]:
+        print(f"#{result['rank']:<3d} score {result['score']:.4f}  rel err {result['mean_rel_error']:.4f}  "
+              f"rmse {result['rmse']:8.2f}  missed {result['missed']}/{result['segments']}  {formatParams(result['params'])}")
+
+    if len(ranked) < len(results):
+        print(f"{len(results) - len(ranked)} configurations collected no scorable calibration points and are not ranked")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
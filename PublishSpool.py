@@ -0,0 +1,190 @@
+import os
+import struct
+import threading
+import time
+
+
+class PublishSpool:
+    """Bounded on-disk FIFO of MQTT messages held back while the broker is unreachable.
+
+    Messages are appended to segment files (`spool-<n>.seg`, a new one every
+    `segment_bytes`) as a RECORD header (payload length, topic length) followed
+    by topic and payload. The read position is kept in a cursor file, so
+    messages spooled before a restart are still replayed afterwards. When the
+    spool would grow beyond `max_bytes` the oldest segment is dropped and its
+    messages are counted in `dropped`.
+
+    append() only queues the record in memory, so the publishing thread does
+    no disk I/O; flush() writes the queue out once it holds `flush_bytes` or
+    its oldest record is `flush_interval` seconds old (SensorMQTTClient calls
+    it from its replay thread). Records not yet flushed are lost on a crash.
+    """
+
+    RECORD = struct.Struct("<IH")
+    CURSOR = struct.Struct("<QQ")
+    PREFIX = "spool-"
+    SUFFIX = ".seg"
+
+    def __init__(self, directory:str = "spool", segment_bytes:int = 1 << 20, max_bytes:int = 64 << 20,
+                 flush_bytes:int = 64 << 10, flush_interval:float = 0.5, dbg:bool = False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max(max_bytes, segment_bytes)
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.dbg = dbg
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.buffer_since = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments = sorted(int(f[len(self.PREFIX):-len(self.SUFFIX)]) for f in os.listdir(directory)
+                               if f.startswith(self.PREFIX) and f.endswith(self.SUFFIX))
+        (self.read_seg, self.read_pos) = self.__load_cursor()
+        for seg in [s for s in self.segments if s < self.read_seg]:
+            os.remove(self.__path(seg))     #consumed, but not deleted before a crash
+        self.segments = [s for s in self.segments if s >= self.read_seg]
+        if not self.segments or self.segments[0] != self.read_seg:
+            (self.read_seg, self.read_pos) = (self.segments[0], 0) if self.segments else (self.read_seg, 0)
+        if not self.segments:
+            self.segments = [self.read_seg]
+
+        self.writer = open(self.__path(self.segments[-1]), "ab")
+        self.size = sum(os.path.getsize(self.__path(s)) for s in self.segments) - self.read_pos
+        self.count = sum(self.__count(s, self.__start(s)) for s in self.segments)
+
+    def __len__(self):
+        return self.count
+
+    def __path(self, seg:int) -> str:
+        return os.path.join(self.directory, f"{self.PREFIX}{seg:08d}{self.SUFFIX}")
+
+    def __start(self, seg:int) -> int:
+        return self.read_pos if seg == self.read_seg else 0
+
+    def __load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, "cursor"), "rb") as file:
+                return self.CURSOR.unpack(file.read(self.CURSOR.size))
+        except (OSError, struct.error):
+            return (self.segments[0] if self.segments else 0, 0)
+
+    def __save_cursor(self):
+        tmp_name = os.path.join(self.directory, "cursor.tmp")
+        with open(tmp_name, "wb") as file:
+            file.write(self.CURSOR.pack(self.read_seg, self.read_pos))
+        os.replace(tmp_name, os.path.join(self.directory, "cursor"))
+
+    def __records(self, seg:int, pos:int):
+        """Yield (record length, topic, payload) from `pos` of a segment on."""
+        with open(self.__path(seg), "rb") as file:
+            file.seek(pos)
+            while True:
+                header = file.read(self.RECORD.size)
+                if len(header) < self.RECORD.size:
+                    return
+                (payload_len, topic_len) = self.RECORD.unpack(header)
+                topic = file.read(topic_len)
+                payload = file.read(payload_len)
+                yield self.RECORD.size + topic_len + payload_len, topic, payload
+
+    def __count(self, seg:int, pos:int) -> int:
+        return sum(1 for _ in self.__records(seg, pos))
+
+    def append(self, topic:str, payload:bytes) -> bool:
+        """Queue a message, returns True once a flush() is due for the size budget."""
+        topic_b = topic.encode("utf-8")
+        record = self.RECORD.pack(len(payload), len(topic_b)) + topic_b + payload
+        with self.lock:
+            if not self.buffer:
+                self.buffer_since = time.monotonic()
+            self.buffer.append(record)
+            self.buffer_bytes += len(record)
+            self.size += len(record)
+            self.count += 1
+            return self.buffer_bytes >= self.flush_bytes
+
+    def flush(self, force:bool = False):
+        """Write the queued messages if the size or time budget is used up (or `force`)."""
+        with self.lock:
+            if self.buffer and (force or self.buffer_bytes >= self.flush_bytes
+                                or time.monotonic() - self.buffer_since >= self.flush_interval):
+                self.__write_buffer()
+
+    def __write_buffer(self):
+        for record in self.buffer:
+            if self.writer.tell() > 0 and self.writer.tell() + len(record) > self.segment_bytes:
+                self.writer.close()
+                self.segments.append(self.segments[-1] + 1)
+                self.writer = open(self.__path(self.segments[-1]), "ab")
+            self.writer.write(record)
+        self.writer.flush()
+        self.buffer.clear()
+        self.buffer_bytes = 0
+        while self.size > self.max_bytes and len(self.segments) > 1:
+            self.__drop_oldest()
+
+    def __drop_oldest(self):
+        seg = self.segments[0]
+        path = self.__path(seg)
+        dropped = self.__count(seg, self.read_pos)
+        self.size -= os.path.getsize(path) - self.read_pos
+        self.count -= dropped
+        self.dropped += dropped
+        self.__next_segment()
+        self.__save_cursor()
+        if self.dbg:
+            print(f"[PublishSpool] spool full, dropped {dropped} messages")
+
+    def __next_segment(self):
+        os.remove(self.__path(self.segments.pop(0)))
+        self.read_seg = self.segments[0]
+        self.read_pos = 0
+
+    def peek(self, max_messages:int) -> list:
+        """Return up to `max_messages` of the oldest (topic, payload) pairs without removing them."""
+        messages = []
+        with self.lock:
+            if self.buffer:
+                self.__write_buffer()
+            for seg in self.segments:
+                for _, topic, payload in self.__records(seg, self.__start(seg)):
+                    messages.append((topic.decode("utf-8"), payload))
+                    if len(messages) >= max_messages:
+                        return messages
+        return messages
+
+    def consume(self, n:int):
+        """Remove the `n` oldest messages, once they have been sent."""
+        with self.lock:
+            while n > 0 and self.count > 0:
+                n_before = n
+                for length, _, _ in self.__records(self.read_seg, self.read_pos):
+                    self.read_pos += length
+                    self.size -= length
+                    self.count -= 1
+                    n -= 1
+                    if n == 0:
+                        break
+                if self.read_pos >= os.path.getsize(self.__path(self.read_seg)):
+                    if len(self.segments) > 1:
+                        self.__next_segment()
+                    else:
+                        # all read from the segment being written, start it over
+                        self.writer.truncate(0)
+                        self.writer.seek(0)
+                        self.read_pos = 0
+                elif n == n_before:
+                    break   #count out of sync with the files, never spin
+            self.__save_cursor()
+
+    def stats(self) -> dict:
+        return {"messages": self.count, "bytes": self.size, "segments": len(self.segments), "dropped": self.dropped}
+
+    def close(self):
+        with self.lock:
+            if self.buffer:
+                self.__write_buffer()
+            self.writer.close()
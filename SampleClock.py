@@ -0,0 +1,50 @@
+import time
+from datetime import datetime
+
+
+class SampleClock:
+    """Monotonic sample timestamps plus one wall-clock anchor.
+
+    Samples carry `time.monotonic_ns()` values, which never jump on NTP
+    adjustments. They are turned into wall-clock time (and strings) only at the
+    output edges, relative to the wall-clock time captured together with the
+    anchor. The seconds part of the formatted string is cached, so formatting a
+    stream of samples costs one strftime per second.
+    """
+
+    TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, anchor_mono_ns:int = None, anchor_wall_ns:int = None):
+        if anchor_mono_ns is None:
+            anchor_mono_ns = time.monotonic_ns()
+            anchor_wall_ns = time.time_ns()
+        self.anchor_mono_ns = anchor_mono_ns
+        self.anchor_wall_ns = anchor_wall_ns if anchor_wall_ns is not None else 0
+        self.fmt_cache = (None, None)
+
+    @staticmethod
+    def now() -> int:
+        return time.monotonic_ns()
+
+    def wall_ns(self, t_ns:int) -> int:
+        return t_ns - self.anchor_mono_ns + self.anchor_wall_ns
+
+    def epoch_ms(self, t_ns:int) -> int:
+        return self.wall_ns(t_ns) // 1_000_000
+
+    def to_datetime(self, t_ns:int) -> datetime:
+        return datetime.fromtimestamp(self.wall_ns(t_ns) / 1e9)
+
+    def format(self, t_ns:int) -> str:
+        """Format as `%Y-%m-%d %H:%M:%S.mmm` (local time)."""
+        wall_ms = self.epoch_ms(t_ns)
+        sec = wall_ms // 1000
+        (cached_sec, prefix) = self.fmt_cache
+        if sec != cached_sec:
+            prefix = datetime.fromtimestamp(sec).strftime(self.TIMESTAMP_FORMAT)
+            self.fmt_cache = (sec, prefix)
+        return f"{prefix}.{wall_ms % 1000:03d}"
+
+
+# process-wide clock shared by the sample pipeline
+CLOCK = SampleClock()
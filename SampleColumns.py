@@ -0,0 +1,25 @@
+from array import array
+
+
+class SampleColumns:
+    """Growable (timestamp, value) samples stored as two typed arrays.
+
+    16 bytes per sample (int64 ns timestamp, float64 value) instead of a tuple
+    holding a boxed int and float per sample.
+    """
+
+    __slots__ = ("t_ns", "values")
+
+    def __init__(self):
+        self.t_ns = array("q")
+        self.values = array("d")
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return zip(self.t_ns, self.values)
+
+    def append(self, t_ns:int, value:float):
+        self.t_ns.append(t_ns)
+        self.values.append(value)
@@ -0,0 +1,150 @@
+import argparse
+import math
+import time
+from bisect import bisect_left, insort
+import numpy as np
+
+
+class SampleFilter:
+    """Pre-filter for the pressure stream: running median, then first-order IIR.
+
+    A median over the last `median_len` samples removes single-sample spikes
+    (median_len 0 or 1: off), the IIR `y += iir_alpha * (x - y)` smooths what
+    is left (iir_alpha 0 or 1: off). update() filters one sample using fixed
+    size state only; filterBatch() filters an array with NumPy and leaves the
+    state exactly as if every sample had gone through update().
+    """
+
+    def __init__(self, median_len:int = 0, iir_alpha:float = 0.0):
+        self.median_len = int(median_len) if median_len and median_len > 1 else 0
+        self.iir_alpha = float(iir_alpha) if 0 < iir_alpha < 1 else 0.0
+        self.ring = [0.0] * max(1, self.median_len)
+        self.sorted = []
+        self.count = 0
+        self.y = None
+
+    @property
+    def enabled(self):
+        return bool(self.median_len or self.iir_alpha)
+
+    def latencySamples(self) -> float:
+        """Group delay in samples: (median_len - 1) / 2 for the median, (1 - a) / a for the IIR."""
+        delay = (self.median_len - 1) / 2 if self.median_len else 0.0
+        if self.iir_alpha:
+            delay += (1 - self.iir_alpha) / self.iir_alpha
+        return delay
+
+    def reset(self):
+        self.sorted.clear()
+        self.count = 0
+        self.y = None
+
+    def update(self, x:float) -> float:
+        if self.median_len:
+            n = self.median_len
+            pos = self.count % n
+            if self.count >= n:
+                del self.sorted[bisect_left(self.sorted, self.ring[pos])]
+            self.ring[pos] = x
+            insort(self.sorted, x)
+            self.count += 1
+            k = len(self.sorted)
+            x = self.sorted[k // 2] if k % 2 else (self.sorted[k // 2 - 1] + self.sorted[k // 2]) * 0.5
+        if self.iir_alpha:
+            if self.y is None:
+                self.y = x
+            else:
+                self.y += self.iir_alpha * (x - self.y)
+            x = self.y
+        return x
+
+    def filterBatch(self, values):
+        x = np.asarray(values, dtype=np.float64)
+        if len(x) == 0:
+            return x
+        if self.median_len:
+            x = self.__medianBatch(x)
+        if self.iir_alpha:
+            x = self.__iirBatch(x)
+        return x
+
+    def __medianBatch(self, x):
+        n = self.median_len
+        held = min(self.count, n - 1)
+        prev = np.array([self.ring[i % n] for i in range(self.count - held, self.count)], dtype=np.float64)
+        ext = np.concatenate((prev, x))
+        out = np.empty(len(x))
+        # windows still filling up (start of the stream) are shorter than n
+        warm = min(len(x), max(0, n - 1 - self.count))
+        for i in range(warm):
+            out[i] = np.median(ext[:held + i + 1])
+        if warm < len(x):
+            windows = np.lib.stride_tricks.sliding_window_view(ext, n)
+            out[warm:] = np.median(windows[held + warm - (n - 1):], axis=1)
+
+        # carry the state over, as update() would have left it
+        tail = ext[-n:]
+        count = self.count + len(x)
+        for i, v in enumerate(tail):
+            self.ring[(count - len(tail) + i) % n] = float(v)
+        self.sorted = sorted(float(v) for v in tail)
+        self.count = count
+        return out
+
+    def __iirBatch(self, x):
+        a = self.iir_alpha
+        c = 1 - a
+        y = np.empty(len(x))
+        start = 0
+        if self.y is None:
+            y[0] = x[0]
+            self.y = float(x[0])
+            start = 1
+        # y_i = c^(i+1) * (y_prev + a * sum_k<=i x_k c^-(k+1)), blocks keep c^-block <= 1e6
+        block = max(1, int(math.log(1e6) / -math.log(c)))
+        pw = c ** np.arange(1, block + 1)
+        for s in range(start, len(x), block):
+            xb = x[s:s + block]
+            m = len(xb)
+            y[s:s + m] = pw[:m] * (self.y + a * np.cumsum(xb / pw[:m]))
+            self.y = float(y[s + m - 1])
+        return y
+
+
+if __name__ == "__main__":
+    from AlgoPressureToWeight import AlgoPressureToWeight
+    from LogReplay import LogReplay, SessionLog
+
+    parser = argparse.ArgumentParser(description="Report the cost and effect of the pressure pre-filter on recorded logs")
+    parser.add_argument("logs", nargs="+", help="session logs (CSV or binary)")
+    parser.add_argument("-m", "--median", type=int, default=0, help="Running median length in samples (0: off)")
+    parser.add_argument("-a", "--alpha", type=float, default=0.0, help="IIR coefficient (0: off)")
+    parser.add_argument("-r", "--rate", type=float, default=10, help="Sample rate in Hz to express the delay in ms")
+
+    args = parser.parse_args()
+
+    filt = SampleFilter(args.median, args.alpha)
+    delay = filt.latencySamples()
+    print(f"median {filt.median_len}, iir {filt.iir_alpha}: delay {delay:.1f} samples ({delay * 1000 / args.rate:.0f} ms at {args.rate:g} Hz)")
+    for file_name in args.logs:
+        log = SessionLog.load(file_name)
+        n = max(1, len(log))
+
+        filt = SampleFilter(args.median, args.alpha)
+        t_start = time.perf_counter()
+        streamed = [filt.update(v) for v in log.pressure.tolist()]
+        t_stream = time.perf_counter() - t_start
+        filt = SampleFilter(args.median, args.alpha)
+        t_start = time.perf_counter()
+        batched = filt.filterBatch(log.pressure)
+        t_batch = time.perf_counter() - t_start
+        max_dev = float(np.max(np.abs(np.asarray(streamed) - batched))) if len(log) else 0.0
+
+        windows = []
+        for cfg in ({}, {"prefilter_median": args.median, "prefilter_iir": args.alpha}):
+            algo = AlgoPressureToWeight(dbg=False, cfg=cfg)
+            events = LogReplay(algo).runStreaming(log)
+            windows.append((algo.n_windows, len(events)))
+
+        print(f"{file_name}: {t_stream * 1e9 / n:.0f} ns/sample streaming, {t_batch * 1e9 / n:.0f} ns/sample batch "
+              f"(max deviation {max_dev:.1e}); windows {windows[0][0]} -> {windows[1][0]}, events {windows[0][1]} -> {windows[1][1]}")
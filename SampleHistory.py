@@ -0,0 +1,65 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from SampleColumns import SampleColumns
+
+
+class SampleHistory:
+    """The last `capacity` (timestamp, value) samples of one series, searchable by time.
+
+    Samples are kept in preallocated typed arrays used as a ring. Timestamps
+    are arrival times and so never decrease, which makes the ring itself the
+    sorted index: range() finds both ends with bisect in O(log n). append()
+    takes no lock; a query running concurrently (HTTP or MQTT thread) drops
+    any sample that was overwritten while it was being copied.
+    """
+
+    def __init__(self, capacity:int = 36000):
+        self.capacity = max(1, int(capacity))
+        self.t_ns = array("q", bytes(8 * self.capacity))
+        self.values = array("d", bytes(8 * self.capacity))
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def first(self):
+        """Absolute index of the oldest sample still held."""
+        return max(0, self.count - self.capacity)
+
+    def append(self, t_ns:int, value:float):
+        pos = self.count % self.capacity
+        if self.count and t_ns < self.t_ns[pos - 1]:
+            t_ns = self.t_ns[pos - 1]   #keep the index sorted
+        self.t_ns[pos] = t_ns
+        self.values[pos] = value
+        self.count += 1
+
+    def span(self):
+        """(oldest, newest) timestamp held, None if empty."""
+        count = self.count
+        if count == 0:
+            return None
+        return self.t_ns[max(0, count - self.capacity) % self.capacity], self.t_ns[(count - 1) % self.capacity]
+
+    def range(self, t_from:int, t_to:int, max_points:int = 0) -> SampleColumns:
+        """Samples with t_from <= t_ns <= t_to, every n-th one if there are more than `max_points`."""
+        count = self.count
+        first = max(0, count - self.capacity)
+        held = range(first, count)
+        key = lambda i: self.t_ns[i % self.capacity]
+        start = first + bisect_left(held, t_from, key=key)
+        stop = first + bisect_right(held, t_to, key=key)
+        step = 1
+        if max_points and stop - start > max_points:
+            step = -(-(stop - start) // max_points)
+
+        samples = SampleColumns()
+        for i in range(start, stop, step):
+            samples.append(self.t_ns[i % self.capacity], self.values[i % self.capacity])
+        overwritten = self.first - start
+        if overwritten > 0:
+            n = -(-overwritten // step)
+            del samples.t_ns[:n]
+            del samples.values[:n]
+        return samples
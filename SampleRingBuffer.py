@@ -0,0 +1,87 @@
+import numpy as np
+
+
+class SampleRingBuffer:
+    """Fixed-capacity, preallocated ring buffer of samples.
+
+    Samples are addressed by absolute index: the n-th sample ever appended has
+    index n, no matter how often the buffer has wrapped since. An index stays
+    valid (and keeps pointing at the same sample) for as long as the sample is
+    still held, i.e. while first <= idx <= last.
+    """
+
+    def __init__(self, capacity:int):
+        self.capacity = int(capacity)
+        self.values = np.zeros(self.capacity, dtype=np.float64)
+        self.seqs = np.zeros(self.capacity, dtype=np.int64)
+        self.timestamps = np.zeros(self.capacity, dtype=np.int64)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def first(self):
+        """Absolute index of the oldest sample still held."""
+        return max(0, self.count - self.capacity)
+
+    @property
+    def last(self):
+        """Absolute index of the newest sample, -1 if empty."""
+        return self.count - 1
+
+    def clear(self):
+        self.count = 0
+
+    def resize(self, capacity:int):
+        """Change the capacity, keeping the newest samples and their absolute indices."""
+        capacity = int(capacity)
+        if capacity == self.capacity:
+            return
+        idx = np.arange(max(self.first, self.count - capacity), self.count)
+        values = np.zeros(capacity, dtype=np.float64)
+        seqs = np.zeros(capacity, dtype=np.int64)
+        timestamps = np.zeros(capacity, dtype=np.int64)
+        values[idx % capacity] = self.values[idx % self.capacity]
+        seqs[idx % capacity] = self.seqs[idx % self.capacity]
+        timestamps[idx % capacity] = self.timestamps[idx % self.capacity]
+        self.capacity = capacity
+        self.values = values
+        self.seqs = seqs
+        self.timestamps = timestamps
+
+    def append(self, val:float, seq:int, timestamp:int):
+        pos = self.count % self.capacity
+        self.values[pos] = val
+        self.seqs[pos] = seq
+        self.timestamps[pos] = timestamp
+        self.count += 1
+
+    def contains(self, idx:int):
+        return self.first <= idx <= self.last
+
+    def clamp(self, idx:int):
+        """Clamp an absolute index into the range of samples still held."""
+        if idx < self.first:
+            return self.first
+        if idx > self.last:
+            return self.last
+        return idx
+
+    def value(self, idx:int):
+        return self.values[idx % self.capacity]
+
+    def seq(self, idx:int):
+        return int(self.seqs[idx % self.capacity])
+
+    def timestamp(self, idx:int):
+        return int(self.timestamps[idx % self.capacity])
+
+    def latest(self, n:int):
+        """Return the newest n values in chronological order."""
+        n = min(n, len(self))
+        stop = self.count % self.capacity
+        start = stop - n
+        if start >= 0:
+            return self.values[start:stop]
+        return np.concatenate((self.values[start:], self.values[:stop]))
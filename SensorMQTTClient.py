@@ -1,10 +1,15 @@
 import paho.mqtt.client as mqtt
 import json
 import random
+import threading
 import time
+from SampleClock import CLOCK
+from TopicTrie import TopicTrie
+from PublishSpool import PublishSpool
 
 class SensorMQTTClient:
-    def __init__(self, hostname, port=1883, user=None, password=None, clientid=None, dbg = False):
+    def __init__(self, hostname, port=1883, user=None, password=None, clientid=None, dbg = False,
+                 spool:PublishSpool = None, reconnect_delay = (1, 60), replay_rate:float = 200):
         """
         Initialize the MQTT client.
         
@@ -13,11 +18,23 @@ class SensorMQTTClient:
         :param user: Optional username for authentication.
         :param password: Optional password for authentication.
         :param clientid: Optional client ID (if None, a random one is assigned).
+        :param spool: Optional PublishSpool keeping messages published while disconnected.
+        :param reconnect_delay: (min, max) seconds between reconnect attempts, doubling in between.
+        :param replay_rate: Messages per second sent from the spool after a reconnect.
         """
         self.hostname = hostname
         self.port = port
         self.client = mqtt.Client(client_id=clientid)  # Create an MQTT client
         self.dbg = dbg
+        self.client.reconnect_delay_set(min_delay=reconnect_delay[0], max_delay=reconnect_delay[1])
+
+        self.connected = False
+        self.connects = 0
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self.replay_wake = threading.Event()
+        self.replay_thread = None
+        self.stopping = False
         
         # Set authentication if provided
         if user and password:
@@ -25,17 +42,51 @@ class SensorMQTTClient:
 
         # Dictionary to store users and their subscribed topics with callbacks
         self.subscribers = {}
+        # Same callbacks keyed by topic filter, for wildcard (+, #) matching
+        self.topic_trie = TopicTrie()
 
         # Set callback functions
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
 
+    @classmethod
+    def fromConfig(cls, config:dict, dbg = False):
+        """Create a client from the mqtt_* keys of an app or gateway config."""
+        spool = None
+        spool_cfg = config.get("mqtt_spool", {})
+        if spool_cfg.get("enabled", False):
+            spool = PublishSpool(
+                spool_cfg.get("dir", "spool"),
+                segment_bytes=spool_cfg.get("segment_bytes", 1 << 20),
+                max_bytes=spool_cfg.get("max_bytes", 64 << 20),
+                flush_bytes=spool_cfg.get("flush_bytes", 64 << 10),
+                flush_interval=spool_cfg.get("flush_interval", 0.5),
+                dbg=dbg)
+        return cls(
+            hostname=config.get("mqtt_hostname", "localhost"),
+            port=config.get("mqtt_port", 1883),
+            user=config.get("mqtt_user", None),
+            password=config.get("mqtt_password", None),
+            clientid=config.get("mqtt_client_id", None),
+            dbg=dbg,
+            spool=spool,
+            reconnect_delay=config.get("mqtt_reconnect_delay", (1, 60)),
+            replay_rate=spool_cfg.get("replay_rate", 200))
+
     def on_connect(self, client, userdata, flags, rc):
         """Handles connection to the MQTT broker."""
         if rc == 0:
+            self.connected = True
+            self.connects += 1
             if self.dbg:
                 print(f"Connected to MQTT Broker at {self.hostname}:{self.port}")
+            # (re)subscribe: subscriptions made while disconnected or before a reconnect are gone
+            for topic in self.subscribers:
+                client.subscribe(topic)
+            if self.spool is not None and len(self.spool) > 0:
+                print(f"Connected to MQTT Broker, replaying {len(self.spool)} spooled messages")
+                self.replay_wake.set()
         else:
             if self.dbg:
                 print(f"Failed to connect, return code {rc}")
@@ -47,26 +98,85 @@ class SensorMQTTClient:
             if self.dbg:
                 print(f"Received message on topic:[{msg.topic}]: payload:[{payload}]")
             
-            # Notify all users subscribed to this topic
-            if msg.topic in self.subscribers:
-                for callback in self.subscribers[msg.topic]:
-                    callback(msg.topic, payload)
+            # Notify all users subscribed to a filter matching this topic
+            for callback in self.topic_trie.match(msg.topic):
+                callback(msg.topic, payload)
         except Exception as e:
             print(f"Error processing message: {e}")
 
     def on_disconnect(self, client, userdata, rc):
-        """Handles unexpected disconnection."""
-        if self.dbg:
-            print("Disconnected from MQTT Broker. Reconnecting...")
-        client.reconnect()
+        """Handles disconnection, the network loop reconnects with backoff."""
+        self.connected = False
+        if rc != 0 and (self.dbg or self.spool is not None):
+            spooled = f", spooling messages ({len(self.spool)} so far)" if self.spool is not None else ""
+            print(f"Disconnected from MQTT Broker (rc {rc}). Reconnecting{spooled}...")
+
+    def __send(self, topic, payload):
+        spool = self.spool
+        # while anything is spooled new messages queue up behind it, to keep the order
+        if spool is not None and (not self.connected or len(spool) > 0):
+            self.__spool(topic, payload)
+            return
+        info = self.client.publish(topic, payload)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS and spool is not None:
+            self.__spool(topic, payload)
+
+    def __spool(self, topic, payload):
+        # no disk I/O here, the replay thread flushes the spool on its size and time budget
+        flush_due = self.spool.append(topic, payload if isinstance(payload, bytes) else payload.encode("utf-8"))
+        if flush_due or self.connected:
+            self.replay_wake.set()
+
+    def __replay(self):
+        """Flush the spool to disk and send spooled messages in order at replay_rate while connected."""
+        batch_len = max(1, int(self.replay_rate / 10))
+        while not self.stopping:
+            self.replay_wake.wait(self.spool.flush_interval)
+            self.replay_wake.clear()
+            self.spool.flush()
+            while self.connected and len(self.spool) > 0 and not self.stopping:
+                t_start = time.monotonic()
+                batch = self.spool.peek(batch_len)
+                sent = 0
+                for topic, payload in batch:
+                    if self.client.publish(topic, payload).rc != mqtt.MQTT_ERR_SUCCESS:
+                        break
+                    sent += 1
+                self.spool.consume(sent)
+                if sent < len(batch):
+                    break
+                delay = sent / self.replay_rate - (time.monotonic() - t_start)
+                if delay > 0:
+                    time.sleep(delay)
+            if self.dbg and self.connected and len(self.spool) == 0:
+                print("Spool replayed")
+
+    def stats(self) -> dict:
+        stats = {"connected": self.connected, "connects": self.connects}
+        if self.spool is not None:
+            stats["spool"] = self.spool.stats()
+        return stats
 
     def publish(self, topic, message):
         """Publishes a message to a specified topic."""
-        self.client.publish(topic, json.dumps(message))
+        self.__send(topic, json.dumps(message))
         #self.client.publish(topic, (message))
         if self.dbg:
             print(f"Published to {topic}: {message}")
 
+    def publish_sample(self, topic, value, t_ns:int):
+        """Publishes {"value", "timestamp"} for a sample with a monotonic timestamp (see SampleClock)."""
+        self.publish(topic, {
+            "value": value,
+            "timestamp": CLOCK.format(t_ns)
+        })
+
+    def publish_raw(self, topic, payload:bytes):
+        """Publishes an already encoded (e.g. binary) payload to a specified topic."""
+        self.__send(topic, payload)
+        if self.dbg:
+            print(f"Published {len(payload)} bytes to {topic}")
+
     def subscribe(self, topic, callback):
         """Subscribe a user to a topic with their corresponding callback."""
         if topic not in self.subscribers:
@@ -74,6 +184,7 @@ class SensorMQTTClient:
 
         # Add the callback to the topic's list of subscribers
         self.subscribers[topic].append(callback)
+        self.topic_trie.insert(topic, callback)
         self.client.subscribe(topic)
         if self.dbg:
             print(f"Subscribed to topic: {topic}")
@@ -82,15 +193,25 @@ class SensorMQTTClient:
         """Connects to the MQTT broker and starts the loop."""
         if self.dbg:
             print("Starting MQTT client...")
-        self.client.connect(self.hostname, self.port, 60)
+        # connect from the background loop, so an unreachable broker is retried instead of raising
+        self.client.connect_async(self.hostname, self.port, 60)
         self.client.loop_start()  # Start the background loop
+        if self.spool is not None:
+            self.replay_thread = threading.Thread(target=self.__replay, name="SensorMQTTClient-spool", daemon=True)
+            self.replay_thread.start()
 
     def stop(self):
         """Stops the MQTT client."""
         if self.dbg:
             print("Stopping MQTT client...")
-        self.client.loop_stop()
+        self.stopping = True
+        if self.replay_thread is not None:
+            self.replay_wake.set()
+            self.replay_thread.join()
         self.client.disconnect()
+        self.client.loop_stop()
+        if self.spool is not None:
+            self.spool.close()
 
 
 # Test code to run when the script is executed directly
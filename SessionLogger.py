@@ -0,0 +1,138 @@
+import atexit
+import gzip
+import os
+import shutil
+import threading
+from collections import deque
+from datetime import datetime
+
+
+class SessionLogger:
+    """Non-blocking session log writer.
+
+    write() only appends the row to a bounded in-memory queue and never touches
+    the disk; a background thread writes queued rows in batches and flushes
+    once `batch_rows` rows are pending or every `flush_interval` seconds.
+    With `binary` set, rows (and the header) are bytes instead of str.
+    When a file grows beyond `rotate_bytes` it is closed, optionally gzipped
+    and a new file (with header) is started. Rows arriving while the queue is
+    full are dropped and counted in `dropped`.
+    """
+
+    def __init__(self, name_fn, header:str = None, batch_rows:int = 256, flush_interval:float = 1.0,
+                 rotate_bytes:int = 0, compress:bool = True, queue_len:int = 10000, binary:bool = False,
+                 dbg:bool = False):
+        self.name_fn = name_fn
+        self.header = header
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.compress = compress
+        self.queue_len = queue_len
+        self.binary = binary
+        self.dbg = dbg
+
+        self.rows = deque()
+        self.written = 0
+        self.dropped = 0
+        self.file = None
+        self.file_name = None
+        self.file_bytes = 0
+
+        self.wake = threading.Event()
+        self.stopping = False
+        self.__open()
+        self.thread = threading.Thread(target=self.__run, name="SessionLogger", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def timestamped(suffix:str):
+        """Name files `<start time><suffix>`, e.g. `2025-01-01 12-00-00.000-Nicla.csv`."""
+        def name_fn():
+            timestamp = datetime.now().strftime("%Y-%m-%d %H-%M-%S.%f")[:-3]
+            return f"{timestamp}{suffix}"
+        return name_fn
+
+    @staticmethod
+    def numbered(file_name:str):
+        """Use `file_name` first, then `<root>.1<ext>`, `<root>.2<ext>`, ... after rotation."""
+        root, ext = os.path.splitext(file_name)
+        count = [0]
+        def name_fn():
+            n = count[0]
+            count[0] += 1
+            return file_name if n == 0 else f"{root}.{n}{ext}"
+        return name_fn
+
+    def write(self, row) -> bool:
+        """Queue a row for writing, returns False if it was dropped."""
+        if len(self.rows) >= self.queue_len or self.stopping:
+            self.dropped += 1
+            return False
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_rows:
+            self.wake.set()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "file": self.file_name,
+            "pending": len(self.rows),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+    def close(self):
+        if self.stopping:
+            return
+        self.stopping = True
+        self.wake.set()
+        self.thread.join()
+        if self.dbg or self.dropped:
+            print(f"[SessionLogger] {self.file_name}: {self.written} rows written, {self.dropped} dropped")
+
+    def __open(self):
+        self.file_name = self.name_fn()
+        self.file = open(self.file_name, "wb" if self.binary else "w")
+        self.file_bytes = 0
+        if self.header is not None:
+            self.file.write(self.header)
+            self.file_bytes += len(self.header)
+
+    def __rotate(self):
+        self.file.close()
+        rotated = self.file_name
+        self.__open()
+        if self.compress:
+            with open(rotated, "rb") as f_in, gzip.open(rotated + ".gz", "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            os.remove(rotated)
+        if self.dbg:
+            print(f"[SessionLogger] rotated {rotated}, now writing {self.file_name}")
+
+    def __write_pending(self):
+        batch = []
+        rows = self.rows
+        while rows:
+            batch.append(rows.popleft())
+        if not batch:
+            return
+        chunk = (b"" if self.binary else "").join(batch)
+        self.file.write(chunk)
+        self.file.flush()
+        self.written += len(batch)
+        self.file_bytes += len(chunk)
+        if self.rotate_bytes and self.file_bytes >= self.rotate_bytes:
+            self.__rotate()
+
+    def __run(self):
+        while not self.stopping:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            try:
+                self.__write_pending()
+            except OSError as e:
+                print(f"[SessionLogger] write failed: {e}")
+        self.__write_pending()
+        self.file.close()
@@ -0,0 +1,290 @@
+import asyncio
+import json
+import multiprocessing
+import struct
+import threading
+import time
+from BaroScaleGateway import BaroScaleGateway
+from SensorMQTTClient import SensorMQTTClient
+from ShmRing import ShmRing
+from TopicTrie import TopicTrie
+
+
+class ShardPublisher:
+    """Stand-in for SensorMQTTClient inside a shard worker.
+
+    Publishes and subscriptions are encoded as records into the worker's
+    outbox ring, where the supervisor picks them up and sends them over its
+    single MQTT connection; samples travel as packed binary, not JSON.
+    Messages for subscribed topics come back through the inbox ring and are
+    dispatched by pump() on the worker's event loop. The outbox has a single
+    producer slot, so put() serialises the threads publishing in a worker
+    (event loop, notification queue worker, batch flusher).
+    """
+
+    RECORD = struct.Struct("<BH")      #kind, topic length
+    SAMPLE = struct.Struct("<dq?")     #value, t_ns, value is an int
+    KIND_SAMPLE = 1
+    KIND_PUBLISH = 2
+    KIND_RAW = 3
+    KIND_SUBSCRIBE = 4
+    KIND_STATS = 5
+    KIND_MESSAGE = 6
+
+    def __init__(self, outbox:ShmRing, inbox:ShmRing, dbg = False):
+        self.outbox = outbox
+        self.inbox = inbox
+        self.dbg = dbg
+        self.topic_trie = TopicTrie()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def encode(cls, kind:int, topic:str, body:bytes) -> bytes:
+        topic_b = topic.encode("utf-8")
+        return cls.RECORD.pack(kind, len(topic_b)) + topic_b + body
+
+    @classmethod
+    def decode(cls, record:bytes):
+        """Split a record into (kind, topic, body)."""
+        (kind, topic_len) = cls.RECORD.unpack_from(record)
+        start = cls.RECORD.size
+        return kind, record[start:start + topic_len].decode("utf-8"), record[start + topic_len:]
+
+    def put(self, kind:int, topic:str, body:bytes = b"") -> bool:
+        record = self.encode(kind, topic, body)
+        with self.lock:
+            return self.outbox.put(record)
+
+    def publish_sample(self, topic, value, t_ns:int):
+        self.put(self.KIND_SAMPLE, topic, self.SAMPLE.pack(value, t_ns, isinstance(value, int)))
+
+    def publish(self, topic, message):
+        self.put(self.KIND_PUBLISH, topic, json.dumps(message).encode("utf-8"))
+
+    def publish_raw(self, topic, payload:bytes):
+        self.put(self.KIND_RAW, topic, payload)
+
+    def subscribe(self, topic, callback):
+        self.topic_trie.insert(topic, callback)
+        while not self.put(self.KIND_SUBSCRIBE, topic):
+            time.sleep(0.01)    #must not get lost, only happens at setup
+
+    async def pump(self, interval:float = 0.02):
+        """Dispatch the messages the supervisor forwards, until cancelled."""
+        while True:
+            for record in self.inbox.get():
+                (_, topic, body) = self.decode(record)
+                payload = body.decode("utf-8")
+                for callback in self.topic_trie.match(topic):
+                    callback(topic, payload)
+            await asyncio.sleep(interval)
+
+
+class ShardSupervisor:
+    """Spread the gateway's boards over worker processes (shards).
+
+    Every worker runs a BaroScaleGateway for its share of the boards, so BLE
+    handling and AlgoPressureToWeight run on their own core instead of sharing
+    one GIL. The supervisor holds the only MQTT connection: it drains each
+    worker's outbox ring (see ShardPublisher) and forwards command messages
+    to the worker's inbox ring. Workers report their load every
+    `stats_interval` seconds; the reports are published on
+    `bstsn/gateway/shard/<n>/load` and, when the busiest worker is more than
+    `rebalance_ratio` times the average, a better "assignment" (MAC address
+    to worker) for the config is printed. Workers that crash are restarted.
+    """
+
+    def __init__(self, config:dict, workers:int = None, dbg = False):
+        self.config = config
+        self.dbg = dbg
+        shard_cfg = config.get("shards", {})
+        self.workers = workers or shard_cfg.get("workers", 2)
+        self.ring_bytes = shard_cfg.get("ring_bytes", 1 << 20)
+        self.poll_interval = shard_cfg.get("poll_ms", 2) / 1000
+        self.stats_interval = shard_cfg.get("stats_interval", 10)
+        self.rebalance_ratio = shard_cfg.get("rebalance_ratio", 1.5)
+        self.restart_delay = config.get("reconnect_delay", 5)
+
+        macs = [BaroScaleGateway.loadBoardConfig(board)["mac_address"] for board in config["boards"]]
+        self.assignment = self.assignBoards(list(zip(macs, config["boards"])), self.workers, shard_cfg.get("assignment", {}))
+        self.shards = []
+        self.loads = {}
+        self.subscribed = set()
+        self.stopping = False
+        self.context = multiprocessing.get_context("spawn")
+
+    @staticmethod
+    def assignBoards(boards:list, workers:int, assignment:dict) -> list:
+        """Split (mac, board entry) pairs into `workers` lists; boards missing from `assignment` fill up the emptiest."""
+        shards = [[] for _ in range(workers)]
+        for mac, board in boards:
+            if mac in assignment:
+                shards[assignment[mac] % workers].append(board)
+        for mac, board in boards:
+            if mac not in assignment:
+                min(shards, key=len).append(board)
+        return shards
+
+    @staticmethod
+    def suggestAssignment(rates:dict, workers:int) -> dict:
+        """Assign boards by sample rate, largest first onto the least loaded worker."""
+        totals = [0.0] * workers
+        assignment = {}
+        for mac, rate in sorted(rates.items(), key=lambda item: -item[1]):
+            worker = totals.index(min(totals))
+            assignment[mac] = worker
+            totals[worker] += rate
+        return assignment
+
+    def __start_worker(self, index:int):
+        shard = self.shards[index]
+        config = dict(self.config, boards=shard["boards"])
+        shard["process"] = self.context.Process(
+            target=_run_shard, name=f"shard-{index}",
+            args=(index, config, shard["outbox"].name, shard["inbox"].name, self.stats_interval, self.dbg))
+        shard["process"].start()
+        shard["restart_at"] = None
+
+    def __forward(self, inbox:ShmRing):
+        def callback(topic, payload):
+            inbox.put(ShardPublisher.encode(ShardPublisher.KIND_MESSAGE, topic, payload.encode("utf-8")))
+        return callback
+
+    def __dispatch(self, index:int, record:bytes):
+        (kind, topic, body) = ShardPublisher.decode(record)
+        if kind == ShardPublisher.KIND_SAMPLE:
+            (value, t_ns, is_int) = ShardPublisher.SAMPLE.unpack(body)
+            self.mqtt_client.publish_sample(topic, int(value) if is_int else value, t_ns)
+        elif kind in (ShardPublisher.KIND_PUBLISH, ShardPublisher.KIND_RAW):
+            self.mqtt_client.publish_raw(topic, body)
+        elif kind == ShardPublisher.KIND_SUBSCRIBE:
+            # a restarted worker subscribes again, its inbox is still the same
+            if (index, topic) not in self.subscribed:
+                self.subscribed.add((index, topic))
+                self.mqtt_client.subscribe(topic, self.__forward(self.shards[index]["inbox"]))
+        elif kind == ShardPublisher.KIND_STATS:
+            self.__report(index, json.loads(body))
+
+    def __report(self, index:int, stats:dict):
+        stats["outbox_dropped"] = self.shards[index]["outbox"].dropped
+        self.loads[index] = stats
+        self.mqtt_client.publish(f"bstsn/gateway/shard/{index}/load", stats)
+        if self.dbg:
+            print(f"[shard {index}] cpu {stats['cpu']:.0%}, {stats['samples_per_s']:.0f} samples/s, "
+                  f"outbox {stats['outbox_bytes']} bytes, {stats['outbox_dropped']} dropped")
+        if len(self.loads) == self.workers and index == self.workers - 1:
+            cpu = [load["cpu"] for load in self.loads.values()]
+            mean = sum(cpu) / len(cpu)
+            if mean > 0 and max(cpu) > self.rebalance_ratio * mean:
+                rates = {}
+                for load in self.loads.values():
+                    rates.update(load["boards"])
+                print(f"Shard load unbalanced (cpu {', '.join(f'{c:.0%}' for c in cpu)}), "
+                      f"suggested \"assignment\": {json.dumps(self.suggestAssignment(rates, self.workers))}")
+
+    def __check_workers(self) -> bool:
+        """Restart crashed workers, True while any worker is still running or due for a restart."""
+        running = False
+        for index, shard in enumerate(self.shards):
+            process = shard["process"]
+            if process.is_alive():
+                running = True
+            elif process.exitcode != 0 and not self.stopping:
+                running = True
+                if shard["restart_at"] is None:
+                    print(f"[shard {index}] worker exited with code {process.exitcode}, restarting in {self.restart_delay}s")
+                    shard["restart_at"] = time.monotonic() + self.restart_delay
+                elif time.monotonic() >= shard["restart_at"]:
+                    self.__start_worker(index)
+        return running
+
+    def run(self):
+        """Forward the workers' records to MQTT until all workers have ended."""
+        running = True
+        while running:
+            busy = False
+            for index, shard in enumerate(self.shards):
+                records = shard["outbox"].get()
+                busy = busy or bool(records)
+                for record in records:
+                    self.__dispatch(index, record)
+            if not busy:
+                running = self.__check_workers()
+                time.sleep(self.poll_interval)
+
+    def startListeningLoop(self):
+        self.mqtt_client = SensorMQTTClient.fromConfig(self.config, dbg=self.dbg)
+        self.shards = [{"boards": boards, "outbox": ShmRing(capacity=self.ring_bytes),
+                        "inbox": ShmRing(capacity=self.ring_bytes // 16)} for boards in self.assignment]
+        try:
+            for index in range(len(self.shards)):
+                self.__start_worker(index)
+            self.mqtt_client.start()
+            self.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stopping = True
+            for index, shard in enumerate(self.shards):
+                if "process" in shard:
+                    shard["process"].join(5)
+                    if shard["process"].is_alive():
+                        shard["process"].terminate()
+                        shard["process"].join()
+                # whatever the workers got out before they ended
+                for record in shard["outbox"].get(1 << 30):
+                    self.__dispatch(index, record)
+            self.mqtt_client.stop()
+            for shard in self.shards:
+                shard["outbox"].close()
+                shard["inbox"].close()
+
+
+async def _report_load(publisher:ShardPublisher, gateway:BaroScaleGateway, interval:float):
+    t_last = time.monotonic()
+    cpu_last = time.process_time()
+    counts = {app.config["mac_address"]: app.evCnt for app in gateway.apps}
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        cpu = time.process_time()
+        dt = max(now - t_last, 1e-9)
+        rates = {}
+        for app in gateway.apps:
+            mac = app.config["mac_address"]
+            rates[mac] = (app.evCnt - counts[mac]) / dt
+            counts[mac] = app.evCnt
+        stats = {
+            "cpu": (cpu - cpu_last) / dt,
+            "samples_per_s": sum(rates.values()),
+            "boards": rates,
+            "outbox_bytes": len(publisher.outbox),
+        }
+        publisher.put(ShardPublisher.KIND_STATS, "", json.dumps(stats).encode("utf-8"))
+        (t_last, cpu_last) = (now, cpu)
+
+
+def _run_shard(index:int, config:dict, outbox_name:str, inbox_name:str, stats_interval:float, dbg):
+    """Worker process: serve the shard's boards, talk to the supervisor through the rings only."""
+    publisher = ShardPublisher(ShmRing.attach(outbox_name), ShmRing.attach(inbox_name), dbg)
+    gateway = BaroScaleGateway(config=config, dbg=dbg, mqtt_client=publisher)
+
+    async def main():
+        tasks = [asyncio.create_task(publisher.pump()),
+                 asyncio.create_task(_report_load(publisher, gateway, stats_interval))]
+        try:
+            await gateway.run()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for app in gateway.apps:
+            app.ble_client.drain()
+            app.close()
+        publisher.outbox.close()
+        publisher.inbox.close()
@@ -0,0 +1,89 @@
+import struct
+from multiprocessing import shared_memory
+
+
+class ShmRing:
+    """Single producer, single consumer ring of byte records in shared memory.
+
+    The block starts with a header of three counters: `head` (bytes ever
+    written, advanced by the producer only after a record is complete),
+    `tail` (bytes ever read, advanced by the consumer) and `dropped` (records
+    put() refused because the ring was full). Records are a 4 byte length
+    followed by the data and wrap around the end of the buffer. Each counter
+    has exactly one writer, so no lock is needed between the two processes.
+    """
+
+    HEADER = struct.Struct("<QQQ")
+    LENGTH = struct.Struct("<I")
+
+    def __init__(self, name:str = None, capacity:int = 1 << 20, create:bool = True):
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=self.HEADER.size + capacity)
+            self.HEADER.pack_into(self.shm.buf, 0, 0, 0, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.capacity = self.shm.size - self.HEADER.size
+        self.data = self.shm.buf[self.HEADER.size:self.HEADER.size + self.capacity]
+        self.owner = create
+
+    @classmethod
+    def attach(cls, name:str):
+        """Open a ring created by the parent process, which also unlinks it."""
+        return cls(name=name, create=False)
+
+    def __counters(self):
+        return self.HEADER.unpack_from(self.shm.buf, 0)
+
+    def __len__(self):
+        """Bytes waiting to be read."""
+        (head, tail, _) = self.__counters()
+        return head - tail
+
+    @property
+    def dropped(self) -> int:
+        return self.__counters()[2]
+
+    def __write(self, pos:int, chunk:bytes):
+        start = pos % self.capacity
+        first = min(len(chunk), self.capacity - start)
+        self.data[start:start + first] = chunk[:first]
+        if first < len(chunk):
+            self.data[0:len(chunk) - first] = chunk[first:]
+
+    def __read(self, pos:int, n:int) -> bytes:
+        start = pos % self.capacity
+        first = min(n, self.capacity - start)
+        if first == n:
+            return bytes(self.data[start:start + n])
+        return bytes(self.data[start:start + first]) + bytes(self.data[0:n - first])
+
+    def put(self, record:bytes) -> bool:
+        """Append a record (producer side), False and counted as dropped if it does not fit."""
+        (head, tail, dropped) = self.__counters()
+        size = self.LENGTH.size + len(record)
+        if size > self.capacity - (head - tail):
+            struct.pack_into("<Q", self.shm.buf, 16, dropped + 1)
+            return False
+        self.__write(head, self.LENGTH.pack(len(record)))
+        self.__write(head + self.LENGTH.size, record)
+        struct.pack_into("<Q", self.shm.buf, 0, head + size)
+        return True
+
+    def get(self, max_records:int = 256) -> list:
+        """Take up to `max_records` records (consumer side), oldest first."""
+        (head, tail, _) = self.__counters()
+        records = []
+        while tail < head and len(records) < max_records:
+            (n,) = self.LENGTH.unpack(self.__read(tail, self.LENGTH.size))
+            records.append(self.__read(tail + self.LENGTH.size, n))
+            tail += self.LENGTH.size + n
+        if records:
+            struct.pack_into("<Q", self.shm.buf, 8, tail)
+        return records
+
+    def close(self):
+        self.data.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class TemperatureCompensation:
+    """Removes the thermal drift of the pressure signal.
+
+    Quiet (pressure, temperature) pairs are kept in preallocated ring arrays
+    together with a segment id; every event starts a new segment, since the
+    load and with it the pressure level changes there. Every `refit_every`
+    samples the drift coefficient k (Pa/°C) is refitted over the whole window
+    in one vectorized pass, with each segment demeaned on its own so load
+    changes do not leak into k. Segments need `min_spread` °C of temperature
+    range to contribute. compensate() subtracts k * (T - t_ref); the offset
+    keeps the output continuous when k changes.
+    """
+
+    def __init__(self, capacity:int = 3000, min_spread:float = 0.2, refit_every:int = 100):
+        self.capacity = int(capacity)
+        self.min_spread = min_spread
+        self.refit_every = max(1, int(refit_every))
+        self.pressure = np.zeros(self.capacity, dtype=np.float64)
+        self.temperature = np.zeros(self.capacity, dtype=np.float64)
+        self.segment = np.zeros(self.capacity, dtype=np.int64)
+        self.coef = 0.0
+        self.t_ref = None
+        self.offset = 0.0
+        self.reset()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def reset(self):
+        """Forget the collected pairs (not the coefficient) and start a new segment."""
+        self.count = 0
+        self.seg_id = 0
+        self.since_fit = 0
+
+    def breakSegment(self):
+        self.seg_id += 1
+
+    def setReference(self, temperature:float):
+        """Take `temperature` as the one compensated values refer to (e.g. at tare)."""
+        self.t_ref = temperature
+        self.offset = 0.0
+
+    def update(self, pressure:float, temperature:float):
+        """Add a quiet sample, refits every `refit_every` samples."""
+        pos = self.count % self.capacity
+        self.pressure[pos] = pressure
+        self.temperature[pos] = temperature
+        self.segment[pos] = self.seg_id
+        self.count += 1
+        self.since_fit += 1
+        if self.since_fit >= self.refit_every:
+            self.since_fit = 0
+            self.refit(temperature)
+
+    def fit(self):
+        """Least squares k over the window with one intercept per segment, None if underdetermined."""
+        n = len(self)
+        if n < 2:
+            return None
+        p = self.pressure[:n]
+        t = self.temperature[:n]
+        _, seg = np.unique(self.segment[:n], return_inverse=True)
+        cnt = np.bincount(seg)
+        t_c = t - (np.bincount(seg, t) / cnt)[seg]
+        p_c = p - (np.bincount(seg, p) / cnt)[seg]
+        t_max = np.full(len(cnt), -np.inf)
+        t_min = np.full(len(cnt), np.inf)
+        np.maximum.at(t_max, seg, t)
+        np.minimum.at(t_min, seg, t)
+        use = (t_max - t_min)[seg] >= self.min_spread
+        stt = np.dot(t_c[use], t_c[use])
+        if stt <= 0:
+            return None
+        return float(np.dot(t_c[use], p_c[use]) / stt)
+
+    def refit(self, temperature:float):
+        coef = self.fit()
+        if coef is None:
+            return
+        if self.t_ref is not None:
+            self.offset += (self.coef - coef) * (temperature - self.t_ref)
+        self.coef = coef
+
+    def compensate(self, pressure:float, temperature:float) -> float:
+        if self.t_ref is None:
+            self.t_ref = temperature
+        return pressure - self.coef * (temperature - self.t_ref) - self.offset
@@ -0,0 +1,86 @@
+class TopicTrie:
+    """MQTT topic filters in a trie, matched per topic level.
+
+    Filters may use the `+` (one level) and `#` (this and all deeper levels,
+    last level only) wildcards. match() walks at most one branch per level and
+    wildcard, so its cost grows with the topic depth, not the number of
+    filters; results are cached per topic until the filters change. As in
+    MQTT, wildcards at the first level do not match topics starting with `$`.
+    """
+
+    CACHE_SIZE = 4096
+
+    class Node:
+        __slots__ = ("children", "values")
+
+        def __init__(self):
+            self.children = {}
+            self.values = []
+
+    def __init__(self):
+        self.root = TopicTrie.Node()
+        self.cache = {}
+
+    @staticmethod
+    def validFilter(topic_filter:str) -> bool:
+        levels = topic_filter.split("/")
+        for i, level in enumerate(levels):
+            if ("#" in level and (level != "#" or i != len(levels) - 1)) or ("+" in level and level != "+"):
+                return False
+        return True
+
+    def insert(self, topic_filter:str, value):
+        if not self.validFilter(topic_filter):
+            raise ValueError(f"invalid topic filter: {topic_filter}")
+        node = self.root
+        for level in topic_filter.split("/"):
+            node = node.children.setdefault(level, TopicTrie.Node())
+        node.values.append(value)
+        self.cache.clear()
+
+    def remove(self, topic_filter:str, value) -> bool:
+        node = self.root
+        for level in topic_filter.split("/"):
+            node = node.children.get(level)
+            if node is None:
+                return False
+        if value not in node.values:
+            return False
+        node.values.remove(value)
+        self.cache.clear()
+        return True
+
+    def match(self, topic:str) -> list:
+        """All values whose filter matches `topic`, in no particular order."""
+        values = self.cache.get(topic)
+        if values is None:
+            values = []
+            self.__match(self.root, topic.split("/"), 0, values)
+            if len(self.cache) >= self.CACHE_SIZE:
+                self.cache.clear()
+            self.cache[topic] = values
+        return values
+
+    def __match(self, node, levels:list, depth:int, values:list):
+        if depth == len(levels):
+            values.extend(node.values)
+            # "a/#" also matches "a"
+            wild = node.children.get("#")
+            if wild is not None:
+                values.extend(wild.values)
+            return
+        if depth == 0 and levels[0].startswith("$"):
+            child = node.children.get(levels[0])
+            if child is not None:
+                self.__match(child, levels, 1, values)
+            return
+
+        wild = node.children.get("#")
+        if wild is not None:
+            values.extend(wild.values)
+        child = node.children.get("+")
+        if child is not None:
+            self.__match(child, levels, depth + 1, values)
+        child = node.children.get(levels[depth])
+        if child is not None:
+            self.__match(child, levels, depth + 1, values)
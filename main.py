@@ -2,13 +2,14 @@ import asyncio
 import json
 from datetime import datetime
 from bleak import BleakClient
+from SessionLogger import SessionLogger
 
 def load_config(file_name):
     """Load configuration from a JSON file."""
     with open(file_name, "r") as file:
         return json.load(file)
 
-def notification_handler(sender, data, config, file):
+def notification_handler(sender, data, config, logger):
     """Handle notifications from the BLE device."""
     try:
         # Decode the received data
@@ -24,8 +25,7 @@ def notification_handler(sender, data, config, file):
         # Print and write the formatted data
         if config["print_raw_data"]:
             print(f"{formatted_data}")
-        file.write(formatted_data + "\n")
-        file.flush()
+        logger.write(formatted_data + "\n")
     except UnicodeDecodeError:
         print(f"Decoding error for data: {data}")
 
@@ -36,8 +36,15 @@ async def run(config, dbg = False):
             print(f"Connected: {is_connected}")
 
         # Start listening for notifications
-        with open(config["log_file"], "w") as file:
-            await client.start_notify(config["rx_uuid"], lambda sender, data: notification_handler(sender, data, config, file))
+        logger = SessionLogger(
+            SessionLogger.numbered(config["log_file"]),
+            batch_rows=config.get("log_batch_rows", 256),
+            flush_interval=config.get("log_flush_interval", 1.0),
+            rotate_bytes=config.get("log_rotate_bytes", 0),
+            compress=config.get("log_compress", True),
+            queue_len=config.get("log_queue_len", 10000))
+        try:
+            await client.start_notify(config["rx_uuid"], lambda sender, data: notification_handler(sender, data, config, logger))
             print("Notifications started. Press Ctrl+C to stop.")
 
             try:
@@ -48,6 +55,8 @@ async def run(config, dbg = False):
             finally:
                 await client.stop_notify(config["rx_uuid"])
                 print("Notifications stopped.")
+        finally:
+            logger.close()
 
 if __name__ == "__main__":
     # Load configuration from JSON file